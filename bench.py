@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import minMax
+import utils
+
+# reference positions, see its legend, and change its version whenever a position changes
+POSITIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_positions.json")
+STONES = {".": 0, "x": 1, "o": 2}
+# measures where a bigger value is worse, compared with the tolerance
+WORSE_IF_HIGHER = ("time", "nodes", "peak_memory")
+
+
+def load_positions(path):
+    '''
+    :param path: a file like bench_positions.json
+    :return: its content, {"version": .., "size": .., "positions": [..]}
+    '''
+    with open(path) as f:
+        return json.load(f)
+
+
+def engine_of(position, size, vectorized=None):
+    '''
+    a new engine with a cold transposition table set up on the position
+    :param position: one of the positions of the file
+    :param vectorized: whole board searches with numpy, see utils.pattern_search
+    :return: minMax.MinMax with the side to move and the last move of the position
+    '''
+    engine = minMax.MinMax([[0 for _ in range(size)] for _ in range(size)], vectorized)
+    for y, row in enumerate(position["board"]):
+        for x, stone in enumerate(row):
+            if STONES[stone] != 0:
+                engine[x, y] = STONES[stone]
+    engine.role = position["to_move"]
+    x, y = position["last"]
+    engine.last_point = (y, x)
+    return engine
+
+
+def run_position(position, size, depth, repeat, memory, vectorized=None):
+    '''
+    search the position with min_max and with Kill.kill for the side to move
+    :param depth: search depth, None for the depth of the position
+    :param repeat: number of runs, the fastest is kept
+    :param memory: also measure the peak memory of a search, in a separate run as tracemalloc slows it down
+    :return: dict of the measures
+    '''
+    depth = depth or position["depth"]
+    result = {"category": position["category"], "depth": depth}
+    for _ in range(repeat):
+        engine = engine_of(position, size, vectorized)
+        engine.max_depth = depth
+        start = time.perf_counter()
+        x, y = engine.min_max()
+        elapsed = time.perf_counter() - start
+        if "time" not in result or elapsed < result["time"]:
+            result.update(move=[x, y], time=elapsed, nodes=engine.nodes, kill_nodes=engine.kill_nodes)
+
+        engine = engine_of(position, size, vectorized)
+        start = time.perf_counter()
+        win = engine.Kill.kill(engine.role, engine.last_point)
+        elapsed = time.perf_counter() - start
+        if "kill" not in result or elapsed < result["kill"]["time"]:
+            result["kill"] = {"win": win, "time": elapsed, "nodes": engine.Kill.nodes}
+    result["nps"] = (result["nodes"] + result["kill_nodes"]) / max(result["time"], 1e-9)
+
+    if memory:
+        engine = engine_of(position, size, vectorized)
+        engine.max_depth = depth
+        tracemalloc.start()
+        engine.min_max()
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run(path, depth=None, repeat=1, memory=True, names=None, vectorized=None):
+    '''
+    :param names: names of the positions to run, None for all of them
+    :param vectorized: whole board searches with numpy, see utils.pattern_search
+    :return: the report of every position and their total, ready for json
+    '''
+    data = load_positions(path)
+    results = dict()
+    for position in data["positions"]:
+        if names and position["name"] not in names:
+            continue
+        result = run_position(position, data["size"], depth, repeat, memory, vectorized)
+        results[position["name"]] = result
+        print("{:<12} move {:<9} {:>8} nodes {:>9.0f} nps {:>8.3f} s".format(
+            position["name"], str(tuple(result["move"])), result["nodes"] + result["kill_nodes"],
+            result["nps"], result["time"]), file=sys.stderr)
+    nodes = sum(result["nodes"] + result["kill_nodes"] for result in results.values())
+    elapsed = sum(result["time"] for result in results.values())
+    return {
+        "positions": os.path.basename(path),
+        "version": data["version"],
+        "python": platform.python_version(),
+        "evaluator": "numpy" if (utils.numpy is not None if vectorized is None else vectorized) else "python",
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+        "total": {"nodes": nodes, "time": elapsed, "nps": nodes / max(elapsed, 1e-9)},
+    }
+
+
+def check_evaluators(path, repeat=100):
+    '''
+    cross-check ArrayPattern against Pattern on every position
+    :return: list of (position name, Pattern ms, ArrayPattern ms, same patterns)
+    '''
+    data = load_positions(path)
+    checks = []
+    for position in data["positions"]:
+        engine = engine_of(position, data["size"], False)
+        times = []
+        patterns = []
+        for evaluator in (utils.Pattern(engine.board), utils.ArrayPattern(engine.board)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                pattern = evaluator.get_total_pattern(1)
+            times.append((time.perf_counter() - start) / repeat * 1000)
+            patterns.append(pattern)
+        checks.append((position["name"], times[0], times[1], patterns[0] == patterns[1]))
+    return checks
+
+
+def compare(old, new, tolerance, min_time):
+    '''
+    :param old: report of run, the reference
+    :param new: report of run to check
+    :param tolerance: share a measure may grow (or nps drop) before it counts as a regression
+    :param min_time: seconds, time differences below it are noise
+    :return: list of (position name, message, is a regression)
+    '''
+    flags = []
+    for name, before in old["results"].items():
+        after = new["results"].get(name)
+        if after is None:
+            flags.append((name, "missing from the new run", False))
+            continue
+        for measure in WORSE_IF_HIGHER:
+            if measure not in before or measure not in after:
+                continue
+            if measure == "time" and after["time"] - before["time"] < min_time:
+                continue
+            if after[measure] > before[measure] * (1 + tolerance):
+                flags.append((name, "{} {} -> {}".format(measure, round(before[measure], 4),
+                                                         round(after[measure], 4)), True))
+        if after["time"] - before["time"] >= min_time and after["nps"] < before["nps"] * (1 - tolerance):
+            flags.append((name, "nps {:.0f} -> {:.0f}".format(before["nps"], after["nps"]), True))
+        if after["kill"]["win"] != before["kill"]["win"]:
+            flags.append((name, "kill {} -> {}".format(before["kill"]["win"], after["kill"]["win"]), True))
+        if after["move"] != before["move"] or after["depth"] != before["depth"]:
+            flags.append((name, "move {} -> {} (depth {} -> {})".format(
+                before["move"], after["move"], before["depth"], after["depth"]), False))
+    return flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="search reference positions and report nodes, speed and memory as json")
+    parser.add_argument("--positions", default=POSITIONS_FILE)
+    parser.add_argument("--out", default=None, help="json report, printed when not given")
+    parser.add_argument("--depth", type=int, default=None, help="search depth instead of the one of every position")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of every position, the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--only", nargs="*", default=None, help="names of the positions to run")
+    parser.add_argument("--evaluator", choices=("auto", "python", "numpy"), default="auto",
+                        help="whole board search, numpy when installed for auto")
+    parser.add_argument("--check-evaluator", action="store_true",
+                        help="compare the numpy whole board search with the python one on every position")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="flag regressions of report NEW against OLD")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--min-time", type=float, default=0.005)
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = (load_positions(path) for path in args.compare)
+        if old["version"] != new["version"]:
+            parser.error("the reports are for versions {} and {} of the positions".format(old["version"], new["version"]))
+        flags = compare(old, new, args.tolerance, args.min_time)
+        for name, message, regression in flags:
+            print("{:<10} {:<12} {}".format("REGRESSION" if regression else "changed", name, message))
+        print("old {:.0f} nps, new {:.0f} nps".format(old["total"]["nps"], new["total"]["nps"]))
+        sys.exit(1 if any(regression for _, _, regression in flags) else 0)
+
+    if args.check_evaluator:
+        checks = check_evaluators(args.positions)
+        for name, python_time, numpy_time, same in checks:
+            print("{:<12} python {:.3f} ms numpy {:.3f} ms {}".format(
+                name, python_time, numpy_time, "same" if same else "DIFFERENT"))
+        sys.exit(0 if all(same for _, _, _, same in checks) else 1)
+
+    vectorized = {"auto": None, "python": False, "numpy": True}[args.evaluator]
+    report = run(args.positions, args.depth, args.repeat, not args.no_memory, args.only, vectorized)
+    text = json.dumps(report, indent=2)
+    if args.out is None:
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
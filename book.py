@@ -0,0 +1,221 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+
+import minMax
+import utils
+
+# name of the book in the folder of persistent files (info folder)
+BOOK_FILE = "book.bin"
+MAGIC = b"GMKB"
+VERSION = 1
+# magic, version, board size, number of records
+HEADER = struct.Struct("<4sHHI")
+# canonical key, canonical move (x * size + y), weight
+RECORD = struct.Struct("<QHH")
+
+
+def transform(point, symmetry, size):
+    '''
+    one of the 8 symmetries of a square board
+    :param point: (x,y)
+    :param symmetry: 0 to 7, bit 0 mirrors x, bit 1 mirrors y, bit 2 swaps x and y
+    :param size: the board size
+    :return: the transformed point
+    '''
+    x, y = point
+    if symmetry & 1:
+        x = size - 1 - x
+    if symmetry & 2:
+        y = size - 1 - y
+    if symmetry & 4:
+        x, y = y, x
+    return x, y
+
+
+def inverse(point, symmetry, size):
+    '''
+    undo transform(point, symmetry, size)
+    '''
+    x, y = point
+    if symmetry & 4:
+        x, y = y, x
+    if symmetry & 2:
+        y = size - 1 - y
+    if symmetry & 1:
+        x = size - 1 - x
+    return x, y
+
+
+def canonical(board, role, zobrist):
+    '''
+    key of a position that is the same for its 8 symmetries and for both colours:
+    the stones of the side to move always hash as role 1
+    :param board: 20*20 list
+    :param role: the side to move
+    :param zobrist: utils.Zobrist of the board size
+    :return: (smallest key among the symmetries, symmetry giving it)
+    '''
+    size = len(board)
+    stones = [((x, y), 1 if board[x][y] == role else 2)
+              for x in range(size) for y in range(size) if board[x][y] in (1, 2)]
+    best = None
+    for symmetry in range(8):
+        key = 0
+        for point, stone in stones:
+            x, y = transform(point, symmetry, size)
+            key ^= zobrist.keys[stone][x][y]
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    return best
+
+
+class Book:
+    '''
+    opening book: sorted fixed-size records in a binary file, read through mmap with a binary search
+    '''
+
+    def __init__(self, path):
+        '''
+        :param path: the book file, see Book.write
+        '''
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not an opening book".format(path))
+        self.zobrist = utils.Zobrist(self.size)
+
+    @staticmethod
+    def open(path):
+        '''
+        :return: the Book, or None if there is no valid book at path
+        '''
+        if not os.path.isfile(path):
+            return None
+        try:
+            return Book(path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def record(self, index):
+        return RECORD.unpack_from(self.data, HEADER.size + index * RECORD.size)
+
+    def moves(self, key):
+        '''
+        :param key: canonical key
+        :return: list of (canonical move, weight) stored for the key
+        '''
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.count:
+            record_key, move, weight = self.record(low)
+            if record_key != key:
+                break
+            moves.append((move, weight))
+            low += 1
+        return moves
+
+    def probe(self, board, role):
+        '''
+        :param board: 20*20 list
+        :param role: the side to move
+        :return: the book move (x,y) of the position, None if it is not in the book
+        '''
+        if len(board) != self.size:
+            return None
+        key, symmetry = canonical(board, role, self.zobrist)
+        moves = self.moves(key)
+        if len(moves) == 0:
+            return None
+        move, _ = max(moves, key=lambda item: item[1])
+        x, y = inverse((move // self.size, move % self.size), symmetry, self.size)
+        if board[x][y] != 0:
+            return None
+        return x, y
+
+    def entries(self):
+        '''
+        :return: dict {(canonical key, canonical move): weight} of the whole book
+        '''
+        return {(key, move): weight for key, move, weight in (self.record(i) for i in range(self.count))}
+
+    @staticmethod
+    def write(path, size, entries):
+        '''
+        write a book, replacing the file only once it is complete
+        :param entries: dict {(canonical key, canonical move): weight}
+        '''
+        records = sorted(entries.items(), key=lambda item: (item[0][0], -item[1]))
+        temp = path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, size, len(records)))
+            for (key, move), weight in records:
+                f.write(RECORD.pack(key, move, min(weight, 0xFFFF)))
+        os.replace(temp, path)
+
+
+def self_play(entries, size, plies, depth, rand):
+    '''
+    play the first plies of one game engine against engine and count its moves in entries
+    the first two replies are random squares near the centre so that games differ
+    '''
+    engine = minMax.MinMax([[0 for _ in range(size)] for _ in range(size)])
+    engine.max_depth = depth
+    zobrist = utils.Zobrist(size)
+    centre = size // 2
+    for ply in range(plies):
+        if 1 <= ply <= 2:
+            empty = [(x, y) for x in range(centre - 2, centre + 3) for y in range(centre - 2, centre + 3)
+                     if engine[x, y] == 0]
+            x, y = rand.choice(empty)
+        else:
+            x, y = engine.min_max()
+            key, symmetry = canonical(engine.board, engine.role, zobrist)
+            row, col = transform((y, x), symmetry, size)
+            entries[(key, row * size + col)] = entries.get((key, row * size + col), 0) + 1
+        engine[x, y] = engine.role
+        if engine.Score.checkWinner(engine.pattern) != 0:
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build the opening book from self-play")
+    parser.add_argument("--out", default=BOOK_FILE, help="book file, new games are added to it if it exists")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--plies", type=int, default=8, help="moves of every game stored in the book")
+    parser.add_argument("--depth", type=int, default=4, help="search depth of the self-play moves")
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    entries = dict()
+    old = Book.open(args.out)
+    if old is not None:
+        if old.size != args.size:
+            parser.error("{} is a book for size {}".format(args.out, old.size))
+        entries = old.entries()
+        old.close()
+    rand = random.Random(args.seed)
+    for game in range(args.games):
+        self_play(entries, args.size, args.plies, args.depth, rand)
+        print("game {}/{}: {} entries".format(game + 1, args.games, len(entries)))
+    Book.write(args.out, args.size, entries)
+
+
+if __name__ == "__main__":
+    main()
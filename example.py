@@ -1,10 +1,25 @@
+import multiprocessing
+import os
+
+import book
 import minMax as AI
+import parallel
 import pisqpipe as pp
+import profiler
+import utils
 from pisqpipe import DEBUG_EVAL
 
 pp.infotext = 'name="pbrain-pyrandom", author="Jan Stransky", version="1.0", country="Czech Republic", www="https://github.com/stranskyjan/pbrain-pyrandom"'
 
 MAX_BOARD = 100
+# the book file opened (or tried) last, it lives in the folder given by info folder
+book_path = None
+# the weights are read and the worker processes started at the first turn, once the info folder and
+# max_memory are known
+pool_started = False
+# profiler.Profiler of the moves, enabled by the environment variable PBRAIN_PROFILE (1, or the json file
+# written at the end) or by info profile 1
+profile = None
 
 
 def brain_init():
@@ -14,13 +29,30 @@ def brain_init():
     if pp.width > MAX_BOARD or pp.height > MAX_BOARD:
         pp.pipeOut("ERROR Maximal board size is {}".format(MAX_BOARD))
         return
+    if pp.width != pp.height:
+        pp.pipeOut("ERROR only square boards are supported")
+        return
+    if pp.width != AI.board.size:
+        resize_board(pp.width)
     pp.pipeOut("OK")
 
 
+def resize_board(size):
+    '''
+    a new engine for a board of another size, it takes over the workers and the book of the old one
+    '''
+    old = AI.board
+    AI.board = AI.MinMax([[0 for _ in range(size)] for _ in range(size)])
+    AI.board.book = old.book
+    AI.board.pool = old.pool
+    if old.helpers is not None:
+        old.helpers.attach(AI.board)
+    if pool_started:
+        load_weights()
+
+
 def brain_restart():
-    for x in range(pp.width):
-        for y in range(pp.height):
-            AI.board[x, y] = 0
+    AI.board.restart()
     pp.pipeOut("OK")
 
 
@@ -49,22 +81,166 @@ def brain_block(x, y):
         pp.pipeOut("ERROR winning move [{},{}]".format(x, y))
 
 
+def brain_board(stones):
+    '''
+    the position of the BOARD command replaces the board at once
+    '''
+    position = []
+    taken = set()
+    for x, y, who in stones:
+        if not (0 <= x < pp.width and 0 <= y < pp.height) or (x, y) in taken:
+            pp.pipeOut("ERROR stone [{},{}]".format(x, y))
+            continue
+        taken.add((x, y))
+        position.append(((x, y), who))
+    AI.board.load_position(position)
+
+
 def brain_takeback(x, y):
     if 0 <= x < pp.width and 0 <= y < pp.height and AI.board[x, y] != 0:
-        AI.board[x, y] = 0
+        # a stone outside the move history, a blocked square, is taken through the whole board search
+        if not AI.board.takeback((x, y)):
+            AI.board[x, y] = 0
         return 0
     return 2
 
 
+def load_book():
+    global book_path
+    if not pp.dataFolder:
+        return
+    path = os.path.join(pp.dataFolder, book.BOOK_FILE)
+    if path != book_path:
+        book_path = path
+        if AI.board.book is not None:
+            AI.board.book.close()
+        AI.board.book = book.Book.open(path)
+
+
+def load_weights():
+    '''
+    read the weights of the evaluation from the info folder, the default ones stay without a valid file
+    :return: the path of the file read, None if there is none
+    '''
+    if not pp.dataFolder:
+        return None
+    path = os.path.join(pp.dataFolder, utils.Score.WEIGHTS_FILE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        AI.board.Score.load(path)
+    except (OSError, ValueError):
+        return None
+    return path
+
+
+def start_pool():
+    '''
+    the weights of the evaluation and the worker processes, sharing the root of the search or,
+    with PBRAIN_PARALLEL=smp, Lazy SMP helpers; with PBRAIN_PARALLEL=off the brain searches alone
+    '''
+    global pool_started
+    if not pool_started:
+        pool_started = True
+        weights = load_weights()
+        parallel_mode = os.environ.get("PBRAIN_PARALLEL")
+        if parallel_mode == "off":
+            return
+        if parallel_mode == "smp":
+            helpers = parallel.LazySMP.create(pp.info_max_memory, weights=weights)
+            if helpers is not None:
+                helpers.attach(AI.board)
+        else:
+            AI.board.pool = parallel.RootPool.create(pp.info_max_memory, weights=weights)
+
+
+def set_memory():
+    '''
+    size the tables of the brain for the memory the workers leave, again whenever the manager changes
+    info max_memory; the workers keep the memory they started with
+    '''
+    alone = AI.board.pool is None and AI.board.helpers is None
+    max_memory = pp.info_max_memory if alone or not pp.info_max_memory else parallel.MAIN_MEMORY
+    if AI.board.governor.max_memory != max_memory:
+        AI.board.set_max_memory(max_memory)
+
+
+def start_profile():
+    global profile
+    if profile is None and (os.environ.get("PBRAIN_PROFILE") or pp.info_profile):
+        profile = profiler.Profiler()
+        profile.enable()
+
+
+def report(progress):
+    '''
+    the progress of the search as a MESSAGE line, queued so that the search never waits for the manager
+    :param progress: see MinMax.progress, its points are (y,x)
+    '''
+    value = progress["value"]
+    if value is None:
+        score = "-"
+    elif abs(value) >= utils.Score.WIN_BOUND:
+        # the number of plies to the five, see Score.WIN
+        score = "{} in {}".format("win" if value > 0 else "loss", utils.Score.WIN - abs(value))
+    else:
+        score = "{:.0f}".format(value)
+    move = progress["move"]
+    pp.telemetryOut("MESSAGE {}depth {}/{} nodes {} nps {:.0f} time {:.0f} ms move {} score {} pv {}".format(
+        "final " if progress["final"] else "", progress["finished"], progress["depth"], progress["nodes"],
+        progress["nps"], progress["time"], "-" if move is None else "{},{}".format(move[1], move[0]), score,
+        " ".join("{},{}".format(y, x) for x, y in progress["pv"]) or "-"))
+
+
 def brain_turn():
-    if pp.terminateAI:
+    # a STOP (2) that came before the search still wants a move, the best candidate then
+    if pp.terminateAI == 1:
+        return
+    load_book()
+    start_pool()
+    set_memory()
+    start_profile()
+    if profile is not None:
+        profile.start_move()
+    timer = utils.Timer(pp.info_timeout_turn, pp.info_time_left, stop=lambda: pp.terminateAI)
+    AI.board.report_interval = pp.info_telemetry
+    x, y = AI.board.min_max(timer, report if pp.info_telemetry else None)
+    if profile is not None:
+        move = profile.end_move(AI.board)
+        for line in profile.lines("profile move {}".format(len(profile.moves)), move):
+            pp.pipeOut("DEBUG " + line)
+    if pp.terminateAI == 1:
         return
-    x, y = AI.board.min_max()
     pp.do_mymove(x, y)
 
 
+def brain_ponder():
+    '''
+    search on the opponent's time: play its most likely reply and search the answer until the manager talks again
+    if the opponent plays it, min_max goes on from the iterations finished here, otherwise the stones are
+    as before and only the transposition tables are kept
+    '''
+    move = AI.board.predict()
+    if move is None or pp.terminateAI:
+        return
+    AI.board[move] = 2
+    try:
+        AI.board.min_max(utils.Timer(float("inf"), float("inf"), stop=lambda: pp.terminateAI))
+    finally:
+        AI.board[move] = 0
+
+
 def brain_end():
-    pass
+    if AI.board.pool is not None:
+        AI.board.pool.close()
+    if AI.board.helpers is not None:
+        AI.board.helpers.close()
+    if profile is not None and len(profile.moves) > 0:
+        for line in profile.lines("profile of {} moves".format(len(profile.moves)), profile.total()):
+            pp.pipeOut("DEBUG " + line)
+        path = os.environ.get("PBRAIN_PROFILE", "1")
+        if path != "1":
+            profile.write(path)
 
 
 def brain_about():
@@ -129,9 +305,11 @@ pp.brain_restart = brain_restart
 pp.brain_my = brain_my
 pp.brain_opponents = brain_opponents
 pp.brain_block = brain_block
+pp.brain_board = brain_board
 pp.brain_takeback = brain_takeback
 pp.brain_turn = brain_turn
 pp.brain_end = brain_end
+pp.brain_ponder = brain_ponder
 pp.brain_about = brain_about
 if DEBUG_EVAL:
     pp.brain_eval = brain_eval
@@ -150,6 +328,8 @@ def print_board(board):
 
 
 if __name__ == "__main__":
+    # the worker processes of parallel.py start this executable again
+    multiprocessing.freeze_support()
     pp.main()
     # # AI.board[0, 1] = 1
     # AI.board[9, 9] = 2
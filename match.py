@@ -0,0 +1,374 @@
+import argparse
+import ast
+import concurrent.futures
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+import minMax
+import utils
+
+# seconds a brain may take beyond the time of a move before it loses the game
+GRACE = 5
+
+
+def parse_player(spec):
+    '''
+    :param spec: "engine" or "engine:name=value,..." for a MinMax of this tree, its attributes set to the values
+    (weights=path loads a weights file, vectorized=False the python whole board search), or "cmd:command line"
+    for a brain speaking the protocol of pisqpipe, an older version of this one for example
+    :return: (kind, options or command)
+    '''
+    if spec.startswith("cmd:"):
+        return "cmd", spec[4:]
+    kind, _, text = spec.partition(":")
+    if kind != "engine":
+        raise ValueError("unknown player {}".format(spec))
+    options = dict()
+    for item in filter(None, text.split(",")):
+        name, _, value = item.partition("=")
+        try:
+            options[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            options[name] = value
+    return "engine", options
+
+
+class EnginePlayer:
+    '''
+    a MinMax of this tree playing in the process of the game
+    '''
+
+    def __init__(self, options, time_turn, depth):
+        '''
+        :param options: attributes of the MinMax, see parse_player
+        :param time_turn: milliseconds per move, unused with a depth
+        :param depth: fixed search depth, None to search against the time
+        '''
+        self.options = options
+        self.time_turn = time_turn
+        self.depth = depth
+
+    def start(self, size):
+        self.engine = minMax.MinMax([[0 for _ in range(size)] for _ in range(size)])
+        for name, value in self.options.items():
+            if name == "weights":
+                self.engine.Score.load(value)
+            elif name == "vectorized":
+                self.engine.set_vectorized(value)
+            elif hasattr(self.engine, name):
+                setattr(self.engine, name, value)
+            else:
+                raise ValueError("MinMax has no attribute {}".format(name))
+        if self.depth is not None:
+            self.engine.max_depth = self.depth
+        self.seen = 0
+
+    def move(self, stones):
+        '''
+        :param stones: the stones of the game as ((x,y), who), who 1 for the stones of this player, 2 otherwise
+        :return: the move (x,y)
+        '''
+        if self.seen == 0:
+            self.engine.load_position(stones)
+        else:
+            for point, who in stones[self.seen:]:
+                self.engine[point] = who
+        timer = None if self.depth is not None else utils.Timer(self.time_turn, float("inf"))
+        x, y = self.engine.min_max(timer)
+        self.engine[x, y] = 1
+        self.seen = len(stones) + 1
+        return x, y
+
+    def close(self):
+        pass
+
+
+class ProtocolPlayer:
+    '''
+    a brain in its own process, driven through the Gomocup protocol on its standard input and output
+    '''
+
+    def __init__(self, command, time_turn):
+        '''
+        :param command: command line starting the brain
+        :param time_turn: milliseconds per move, sent as info timeout_turn
+        '''
+        self.command = command
+        self.time_turn = time_turn
+        self.process = None
+
+    def start(self, size):
+        # the brain searches alone and does not ponder, not to take the cores of the other games
+        env = dict(os.environ, PBRAIN_PARALLEL="off")
+        self.process = subprocess.Popen(shlex.split(self.command), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, universal_newlines=True, bufsize=1, env=env)
+        self.lines = queue.Queue()
+        threading.Thread(target=self.read, daemon=True).start()
+        self.send("START {}".format(size))
+        if self.answer(GRACE + 5) != "OK":
+            raise RuntimeError("{} did not start".format(self.command))
+        self.send("INFO ponder 0")
+        self.send("INFO timeout_turn {}".format(self.time_turn))
+        self.send("INFO timeout_match 0")
+        self.send("INFO time_left 2147483647")
+        self.seen = 0
+
+    def read(self):
+        for line in self.process.stdout:
+            self.lines.put(line.strip())
+        self.lines.put(None)
+
+    def send(self, text):
+        self.process.stdin.write(text + "\n")
+        self.process.stdin.flush()
+
+    def answer(self, timeout):
+        '''
+        :return: the next line of the brain that is not a MESSAGE or DEBUG line, None if it gave none in time
+        '''
+        end = time.time() + timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=max(end - time.time(), 0))
+            except queue.Empty:
+                return None
+            if line is None or line.split(" ")[0] not in ("MESSAGE", "DEBUG"):
+                return line
+
+    def move(self, stones):
+        new = stones[self.seen:]
+        if self.seen > 0 and len(new) == 1:
+            (x, y), _ = new[0]
+            self.send("TURN {},{}".format(x, y))
+        else:
+            self.send("BOARD")
+            for (x, y), who in stones:
+                self.send("{},{},{}".format(x, y, who))
+            self.send("DONE")
+        line = self.answer(self.time_turn / 1000 + GRACE)
+        if line is None:
+            raise TimeoutError("no move in time")
+        x, y = (int(part) for part in line.split(","))
+        self.seen = len(stones) + 1
+        return x, y
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.send("END")
+            self.process.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+def new_player(spec, time_turn, depth):
+    kind, options = parse_player(spec)
+    if kind == "cmd":
+        return ProtocolPlayer(options, time_turn)
+    return EnginePlayer(options, time_turn, depth)
+
+
+def random_opening(rand, size, plies, area=7):
+    '''
+    :param plies: stones of the opening, both colours in turn, first player first
+    :param area: the stones lie in the area * area square in the middle of the board
+    :return: list of (x,y)
+    '''
+    low = (size - area) // 2
+    squares = [(x, y) for x in range(low, low + area) for y in range(low, low + area)]
+    return rand.sample(squares, plies)
+
+
+def is_five(board, x, y):
+    '''
+    :return: True if the stone on (x,y) makes five or more in a row
+    '''
+    size = len(board)
+    for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        count = 1
+        for sign in (1, -1):
+            i, j = x + sign * dx, y + sign * dy
+            while 0 <= i < size and 0 <= j < size and board[i][j] == board[x][y]:
+                count += 1
+                i, j = i + sign * dx, j + sign * dy
+        if count >= 5:
+            return True
+    return False
+
+
+def play_game(first, second, opening, size, time_turn, depth):
+    '''
+    :param first: spec of the player of the first stone, see parse_player
+    :param second: spec of the other player
+    :param opening: stones played before the players take over, see random_opening
+    :return: (score of first: 1, 0.5 or 0, number of stones, how the game ended)
+    '''
+    players = [new_player(first, time_turn, depth), new_player(second, time_turn, depth)]
+    board = [[0] * size for _ in range(size)]
+    moves = []
+    for x, y in opening:
+        board[x][y] = len(moves) % 2 + 1
+        moves.append((x, y))
+    try:
+        for turn, player in enumerate(players):
+            try:
+                player.start(size)
+            except Exception as error:
+                return float(turn == 1), len(moves), "player {} failed: {}".format(turn + 1, error)
+        while len(moves) < size * size:
+            turn = len(moves) % 2
+            stones = [(point, 1 if index % 2 == turn else 2) for index, point in enumerate(moves)]
+            try:
+                x, y = players[turn].move(stones)
+            except Exception as error:
+                return float(turn == 1), len(moves), "player {} failed: {}".format(turn + 1, error)
+            if not (0 <= x < size and 0 <= y < size) or board[x][y] != 0:
+                return float(turn == 1), len(moves), "player {} played the illegal move {},{}".format(turn + 1, x, y)
+            board[x][y] = turn + 1
+            moves.append((x, y))
+            if is_five(board, x, y):
+                return float(turn == 0), len(moves), "five"
+        return 0.5, len(moves), "full board"
+    finally:
+        for player in players:
+            player.close()
+
+
+def elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def score_of(elo_difference):
+    return 1 / (1 + 10 ** (-elo_difference / 400))
+
+
+def sprt(wins, draws, losses, elo0, elo1):
+    '''
+    log-likelihood ratio of the hypotheses "elo1" against "elo0" for the results of a match,
+    with the normal approximation of the score of a game
+    :return: LLR, 0 as long as the results give no variance
+    '''
+    games = wins + draws + losses
+    if games == 0:
+        return 0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance == 0:
+        return 0
+    s0, s1 = score_of(elo0), score_of(elo1)
+    return (s1 - s0) * (2 * score - s0 - s1) / (2 * variance / games)
+
+
+def summary(wins, draws, losses):
+    '''
+    :return: (elo of the first player against the second, half width of its 95% interval)
+    '''
+    games = wins + draws + losses
+    if games == 0:
+        return 0, float("inf")
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo(score), (elo(min(score + margin, 1)) - elo(max(score - margin, 0))) / 2
+
+
+def run(test, base, games, workers, time_turn, depth, plies, size, seed, elo0, elo1, alpha, beta):
+    '''
+    play test against base on random openings, each opening once with each colour, until games are played
+    or the SPRT decides
+    :return: report of the match, ready for json
+    '''
+    rand = random.Random(seed)
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    results = {"wins": 0, "draws": 0, "losses": 0}
+    ends = dict()
+    llr = 0
+    verdict = None
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as executor:
+        futures = []
+        for game in range(games):
+            if game % 2 == 0:
+                opening = random_opening(rand, size, plies)
+            test_first = game % 2 == 0
+            players = (test, base) if test_first else (base, test)
+            future = executor.submit(play_game, players[0], players[1], opening, size, time_turn, depth)
+            future.test_first = test_first
+            futures.append(future)
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            score, length, end = future.result()
+            score = score if future.test_first else 1 - score
+            results[{1: "wins", 0.5: "draws", 0: "losses"}[score]] += 1
+            ends[end] = ends.get(end, 0) + 1
+            llr = sprt(results["wins"], results["draws"], results["losses"], elo0, elo1)
+            print("game {:>4}: +{} ={} -{} llr {:.2f} ({:.2f}, {:.2f}) {} stones, {}".format(
+                done, results["wins"], results["draws"], results["losses"], llr, lower, upper, length, end),
+                file=sys.stderr)
+            if llr <= lower or llr >= upper:
+                verdict = "H0" if llr <= lower else "H1"
+                executor.shutdown(cancel_futures=True)
+                break
+    difference, margin = summary(results["wins"], results["draws"], results["losses"])
+    return {
+        "test": test,
+        "base": base,
+        "games": sum(results.values()),
+        "results": results,
+        "ends": ends,
+        "elo": difference,
+        "elo_margin": margin,
+        "sprt": {"elo0": elo0, "elo1": elo1, "alpha": alpha, "beta": beta, "llr": llr,
+                 "bounds": [lower, upper], "verdict": verdict},
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="play two engines against each other and test the first with SPRT")
+    parser.add_argument("test", help='the engine to test, "engine[:name=value,..]" or "cmd:command line"')
+    parser.add_argument("base", help="the engine to compare it with, same form")
+    parser.add_argument("--games", type=int, default=400, help="the most games, stopped earlier by the SPRT")
+    parser.add_argument("--workers", type=int, default=None, help="games played side by side, one per core when not given")
+    parser.add_argument("--time", type=int, default=200, help="milliseconds per move")
+    parser.add_argument("--depth", type=int, default=None, help="fixed search depth of the engines of this tree instead of --time")
+    parser.add_argument("--plies", type=int, default=3, help="random stones of every opening")
+    parser.add_argument("--size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--elo0", type=float, default=-10, help="the test is worse (H0) below this elo difference")
+    parser.add_argument("--elo1", type=float, default=0, help="and not worse (H1) above this one")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--out", default=None, help="json report, printed when not given")
+    args = parser.parse_args()
+
+    for spec in (args.test, args.base):
+        try:
+            parse_player(spec)
+        except ValueError as error:
+            parser.error(str(error))
+    workers = args.workers or multiprocessing.cpu_count()
+    report = run(args.test, args.base, args.games, workers, args.time, args.depth, args.plies, args.size, args.seed,
+                 args.elo0, args.elo1, args.alpha, args.beta)
+    text = json.dumps(report, indent=2)
+    if args.out is None:
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    # a failing build when the test is found worse
+    sys.exit(1 if report["sprt"]["verdict"] == "H0" else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import operator
+import time
 
 import utils
 
@@ -8,24 +8,68 @@ class MinMax:
     Implement minMax algorithm
     '''
 
-    def __init__(self, board_MinMax):
+    def __init__(self, board_MinMax, vectorized=None):
         '''
         configure parameters
         :param board 20*20 list
+        :param vectorized: whole board searches with numpy, see utils.pattern_search
         '''
-        self.board = board_MinMax
+        self.zobrist = utils.Zobrist(len(board_MinMax))
+        self.board = utils.BitBoard(board_MinMax, self.zobrist)
         self.size = len(board_MinMax)
+        # depth searched without a timer, and the deepest iteration when searching against one
         self.max_depth = 2
+        self.depth_limit = 20
+        self.depth = self.max_depth
+        # aspiration windows: half width of the window of an iteration around the expected value, at least
+        # aspiration and aspiration_share of the value; None for full windows, as the values of the
+        # iterations often differ by orders of magnitude here, the failed windows cost more than they save
+        self.aspiration = None
+        self.aspiration_share = 0.25
+        self.timer = None
+        self.aborted = False
+        # positions searched by the last min_max, by negamax and by the kill checks
+        self.nodes = 0
+        self.kill_nodes = 0
         self.kill_depth = 10
         self.last_point = (int(self.size / 2), int(self.size / 2))
         self.role = 1
+        # last move and side to move of the position the move history starts from, see load_position
+        self.history_start = (self.last_point, self.role)
         self.move = (0, 0)
-        self.Kill = utils.Kill(self.board, self.kill_depth)
         self.Score = utils.Score(self.board)
-        self.Pattern = utils.Pattern(self.board)
-        self.Board_ = utils.Board(self.board)
+        self.Pattern = utils.pattern_search(self.board, vectorized)
+        self.frontier = utils.Frontier(self.board)
+        self.Board_ = utils.Board(self.board, self.frontier, self.Score)
         self.pattern = self.Pattern.get_total_pattern(self.role)
-        self.transposition_table = dict()
+        self.evaluator = utils.Evaluator(self.board, self.pattern, self.frontier)
+        self.Kill = utils.Kill(self.board, self.kill_depth)
+        self.transposition_table = utils.TranspositionTable()
+        # killer moves, history and principal variation, kept from one search to the next of a game
+        self.move_order = utils.MoveOrder(self.size)
+        # True while negamax is on the principal variation of the previous iteration
+        self.follow_pv = False
+        # (zobrist key of the root, best move, depth, value) of the last finished iteration, see min_max
+        self.last_search = None
+        # book.Book of opening moves, looked up before searching
+        self.book = None
+        # parallel.RootPool sharing the root of the search between processes, None to search alone
+        self.pool = None
+        # parallel.LazySMP searching the same position in other processes, see LazySMP.attach
+        self.helpers = None
+        # index of this engine among the LazySMP helpers, 0 for the main search
+        self.helper = 0
+        # sizes the tables from info max_memory, see set_max_memory
+        self.governor = utils.MemoryGovernor()
+        # function called with the progress of min_max, see progress, and the least milliseconds between two calls
+        self.report = None
+        self.report_interval = 1000
+        # deepest finished iteration of min_max and its value, None before the first one
+        self.finished = 0
+        self.value = None
+        # time.monotonic() at the start of min_max and at the last call of report
+        self.search_start = None
+        self.last_report = None
 
     def __getitem__(self, point):
         '''
@@ -44,97 +88,437 @@ class MinMax:
         :return:
         '''
         i, j = point
-        self.board[j][i] = role
-        self.pattern = self.Pattern.update(self.pattern, (j, i), role)
-        self.role = 3 - role
-        self.last_point = (j, i)
-        # print("last_point" + str(self.last_point))
+        old_role = self.board[j][i]
+        if old_role == role:
+            return
+        if role in (1, 2) and old_role == 0:
+            self.evaluator.apply((j, i), role)
+            self.role = 3 - role
+            self.last_point = (j, i)
+            # print("last_point" + str(self.last_point))
+            return
+
+        # taking a stone of the move history back, otherwise blocking a square or taking another stone
+        if role == 0 and self.takeback(point):
+            return
+        self.board.remove(j, i)
+        if role != 0:
+            self.board.place(j, i, role)
+        self.evaluator.reset(self.Pattern.get_total_pattern(1))
+        if old_role in (1, 2):
+            self.role = old_role
+
+    def takeback(self, point=None):
+        '''
+        take a stone back through the move history of the evaluator, whose pattern changes are reverted
+        in O(1) per move: the moves played after the stone are taken back and played again
+        :param point: (x,y) of the stone, the last move if None
+        :return: True, False if the stone is not in the move history
+        '''
+        moves = self.evaluator.moves
+        if point is None:
+            index = len(moves) - 1
+        else:
+            target = (point[1], point[0])
+            index = next((index for index in range(len(moves) - 1, -1, -1) if moves[index][0] == target), -1)
+        if index < 0:
+            return False
+        later = []
+        while len(moves) > index + 1:
+            later.append((moves[-1][0], self.board[moves[-1][0][0]][moves[-1][0][1]]))
+            self.evaluator.undo()
+        self.evaluator.undo()
+        for later_point, later_role in reversed(later):
+            self.evaluator.apply(later_point, later_role)
+        if len(moves) > 0:
+            x, y = self.last_point = moves[-1][0]
+            self.role = 3 - self.board[x][y]
+        else:
+            self.last_point, self.role = self.history_start
+        return True
+
+    def replay(self, moves):
+        '''
+        play a sequence of moves, O(1) each
+        :param moves: list of ((x,y), role)
+        '''
+        for point, role in moves:
+            self[point] = role
+
+    def restart(self):
+        '''
+        empty the board for a new game: the moves of the history are taken back one by one,
+        only stones put otherwise (blocked squares) make the pattern computed again
+        '''
+        while len(self.evaluator.moves) > 0:
+            self.evaluator.undo()
+        if not self.board.is_empty():
+            self.clear()
+        self.role = 1
+        self.last_point = (int(self.size / 2), int(self.size / 2))
+        self.history_start = (self.last_point, self.role)
+        self.last_search = None
+        self.move_order.clear()
 
-    def min_max(self):
+    def load_position(self, stones):
+        '''
+        set up a whole position at once, in place of the one on the board: the squares are written,
+        then the bitsets and hash, the pattern and the frontier are built in one pass each
+        the position has no move history, its stones are taken back through the whole board search
+        :param stones: list of ((x,y), role), role 3 for a blocked square, the last stone of role 1 or 2
+        is the last move
+        '''
+        for row in self.board:
+            row[:] = [0] * self.size
+        for (x, y), role in stones:
+            self.board[y][x] = role
+        self.board.clear_bits()
+        self.evaluator.reset(self.Pattern.get_total_pattern(1))
+        moves = [(point, role) for point, role in stones if role in (1, 2)]
+        if len(moves) > 0:
+            (x, y), role = moves[-1]
+            self.last_point = (y, x)
+            self.role = 3 - role
+        else:
+            self.last_point = (int(self.size / 2), int(self.size / 2))
+            self.role = 1
+        self.history_start = (self.last_point, self.role)
+        self.last_search = None
+
+    def clear(self):
+        '''
+        empty the board in one pass, what was learnt for move ordering is kept (see restart)
+        '''
+        self.load_position([])
+
+    def set_vectorized(self, vectorized):
+        '''
+        choose the whole board search from now on, see utils.pattern_search
+        '''
+        self.Pattern = utils.pattern_search(self.board, vectorized)
+
+    def set_max_memory(self, max_memory):
+        '''
+        size the tables for the memory the process may use
+        :param max_memory: bytes, 0 for no limit
+        '''
+        self.governor = utils.MemoryGovernor(max_memory)
+        self.governor.size(self)
+
+    def min_max(self, timer=None, report=None):
+        '''
+        iterative deepening: search depth 1, 2, ... and keep the move of the last finished iteration
+        :param timer: utils.Timer of this move, without it the search goes to self.max_depth
+        :param report: function called with the progress of the search, see progress
+        :return: the chosen move (x,y)
+        '''
+        self.finished = 0
+        self.value = None
         # If the board is empty, return the coordinate in the center of the board
-        if operator.eq(self.board, [[0 for _ in range(self.size)] for _ in range(self.size)]):
+        if self.board.is_empty():
             self.move = int(self.size / 2 - 1), int(self.size / 2 - 1)
             return self.move[1], self.move[0]
 
+        if self.book is not None:
+            move = self.book.probe(self.board, self.role)
+            if move is not None:
+                self.move = move
+                return self.move[1], self.move[0]
+
         # Implememt negative_max algorithm
-        self.negamax(self.max_depth, alpha=-float("inf"), beta=float("inf"), role=self.role,
-                     pattern=self.pattern, last_point=self.last_point)
+        self.governor.govern(self)
+        self.transposition_table.new_search()
+        self.Kill.transposition_table.new_search()
+        self.move_order.new_search()
+        # the principal variation of the previous searches, from the moves played since then
+        self.move_order.pv = self.principal_variation(self.depth_limit)
+        self.timer = timer
+        self.Kill.timer = timer
+        self.aborted = False
+        self.nodes = 0
+        self.kill_nodes = 0
+        self.move = None
+        self.report = report
+        self.search_start = self.last_report = time.monotonic()
+        max_depth = self.max_depth if timer is None else self.depth_limit
+        key = self.board.hash ^ self.zobrist.side[self.role]
+        best_move = None
+        finished = 0
+        value = None
+        # the position has been searched already (while pondering), go on from its last finished iteration
+        if self.last_search is not None and self.last_search[0] == key:
+            _, best_move, finished, value = self.last_search
+        self.finished = finished
+        self.value = value
+        if self.helpers is not None:
+            self.helpers.start(self, max_depth)
+        # values of the finished iterations, by depth
+        values = dict()
+        for depth in range(finished + 1, max_depth + 1):
+            self.depth = depth
+            # aspiration window around the value of the iteration two plies shallower, the last one
+            # with the same side to move at the leaves, opened on the side where it fails
+            expected = values.get(depth - 2)
+            if self.aspiration is None or expected is None or abs(expected) >= utils.Score.WIN_BOUND:
+                alpha, beta = -float("inf"), float("inf")
+            else:
+                window = max(self.aspiration, abs(expected) * self.aspiration_share)
+                alpha, beta = expected - window, expected + window
+            while True:
+                self.follow_pv = True
+                value = self.negamax(depth, alpha, beta, role=self.role, last_point=self.last_point)
+                if self.aborted:
+                    break
+                if value <= alpha:
+                    alpha = -float("inf")
+                elif value >= beta:
+                    beta = float("inf")
+                else:
+                    break
+            if self.aborted:
+                break
+            values[depth] = value
+            best_move = self.move
+            finished = depth
+            self.finished = depth
+            self.value = value
+            self.move_order.pv = self.principal_variation(depth)
+            if report is not None:
+                self.progress()
+            if timer is not None and not timer.can_deepen():
+                break
+        if self.helpers is not None:
+            self.helpers.finish(self)
+        self.timer = None
+        self.Kill.timer = None
+        if best_move is not None:
+            self.last_search = (key, best_move, finished, self.value)
+            self.move = best_move
+        elif self.move is None:
+            # not even the first iteration finished, fall back to the best looking candidate
+            self.move = self.Board_.candidates(self.pattern, self.role, self.last_point)[0][0]
+        if report is not None:
+            self.progress(final=True)
+            self.report = None
         return self.move[1], self.move[0]
 
-    def negamax(self, depth, alpha, beta, role, pattern, last_point):
+    def progress(self, final=False):
+        '''
+        call self.report with the progress of the search, unless it was called less than report_interval ago;
+        the search calls it every few nodes, so it only reads the state min_max keeps, and the report must not block
+        :param final: the search is over, report in any case
+        '''
+        now = time.monotonic()
+        if not final and (now - self.last_report) * 1000 < self.report_interval:
+            return
+        self.last_report = now
+        elapsed = now - self.search_start
+        nodes = self.nodes + self.kill_nodes
+        # the principal variation of the finished iterations, the best move so far of the first one before
+        pv = list(self.move_order.pv) if self.finished else []
+        move = pv[0] if pv else self.move
+        self.report({
+            "depth": self.depth if not final else self.finished,
+            "finished": self.finished,
+            "nodes": nodes,
+            "nps": nodes / elapsed if elapsed > 0 else 0,
+            "time": elapsed * 1000,
+            "move": move,
+            "value": self.value,
+            "pv": pv,
+            "final": final,
+        })
+
+    def predict(self):
+        '''
+        the most likely reply of the side to move, to search while the opponent is thinking
+        :return: (x,y) or None if the game is over
+        '''
+        if self.board.is_empty() or self.Score.checkWinner(self.pattern) != 0:
+            return None
+        entry = self.transposition_table.probe(self.board.hash ^ self.zobrist.side[self.role])
+        if entry is not None and entry.move is not None and self.board[entry.move[0]][entry.move[1]] == 0:
+            return entry.move[1], entry.move[0]
+        free = self.Board_.candidates(self.pattern, self.role, self.last_point)
+        if len(free) == 0:
+            return None
+        return free[0][0][1], free[0][0][0]
+
+    def negamax(self, depth, alpha, beta, role, last_point):
         '''
         implemet negative_max method, which have the same rule as the Min_Max method
         :param depth: define max_depth of min_max search, must be odd, for example: 5
         :param alpha: the alpha value for alpha beta pruning
         :param beta: the beta value for alpha beta pruning
         :param role: AI (role)or Opponent(3-role)
-        :param pattern: A dict save the board pattern message
         :param last_point: the last move position of opponent
         :return: in the end of alpha_beta search, return nothing, but define self.move during search process
         '''
+        self.nodes += 1
+        if self.report is not None and self.nodes & 1023 == 0:
+            self.progress()
+        ply = self.depth - depth
+        # the last move made five, the side to move has lost
+        if ply > 0 and self.pattern[3 - role][utils.FIVE_INDEX] > 0:
+            return -(utils.Score.WIN - ply)
+        # the side to move makes five at once: the candidates rank the five as low as the four it replaces,
+        # so it is played here, at every depth, as the quickest win
+        fives = self.Kill.fives(role)
+        if len(fives) > 0:
+            if depth == self.depth:
+                self.move = min(fives)
+            return utils.Score.WIN - (ply + 1)
         if depth == 0:
-            return self.Score.total_score(pattern, role)
+            return self.Score.total_score(self.pattern, role)
+
+        # out of time, unwind and let min_max drop this iteration
+        if self.timer is not None and self.timer.is_up():
+            self.aborted = True
+            return 0
+
+        # probe the transposition table, the root always searches to set self.move
+        alpha_orig = alpha
+        key = self.board.hash ^ self.zobrist.side[role]
+        entry = self.transposition_table.probe(key)
+        if entry is not None and entry.depth >= depth and depth != self.depth:
+            entry_value = utils.Score.from_table(entry.value, ply)
+            if entry.flag == "EXACT":
+                return entry_value
+            elif entry.flag == "LOWER":
+                alpha = max(alpha, entry_value)
+            elif entry.flag == "UPPER":
+                beta = min(beta, entry_value)
+            if alpha >= beta:
+                return entry_value
 
         # search the most potential positions
-        free = self.Board_.candidates(pattern, role, last_point)
+        free = self.Board_.candidates(self.pattern, role, last_point)
         candidates = []
         count = 0
-        if depth == self.max_depth:
+        if depth == self.depth and self.pool is not None:
+            candidates = self.pool.safe_moves(self, free, role, last_point)
+            if candidates is None:
+                # the workers failed and the pool was dropped, search the root again alone
+                if self.pool is None:
+                    return self.negamax(depth, alpha, beta, role, last_point)
+                self.aborted = True
+                return 0
+        elif depth == self.depth:
             while len(candidates) < 3 and count < 10 and count < len(free):
-                point, new_pattern = free[count]
-                x, y = point
-                self.board[x][y] = role
-                kill_opponent = self.Kill.kill(3 - role, new_pattern, point)
-                self.board[x][y] = 0
+                point, _ = free[count]
+                self.evaluator.apply(point, role)
+                kill_opponent = self.Kill.kill(3 - role, point)
+                self.kill_nodes += self.Kill.nodes
+                self.evaluator.undo()
                 if not kill_opponent:
                     candidates.append(free[count])
                 count += 1
+            if self.timer is not None and self.timer.is_up():
+                self.aborted = True
+                return 0
         else:
             candidates = free[:2]
         # if have no candidates to defend, return first point directly
         if len(candidates) == 0:
             candidates = free[:1]
+        # no square left, a draw
+        if len(candidates) == 0:
+            return 0
+
+        # principal variation first, then the best move stored for this position, the killers and the history
+        pv_move = self.move_order.pv_move(ply) if self.follow_pv else None
+        if pv_move is not None and all(point != pv_move for point, _ in candidates):
+            pv_move = None
+        if pv_move is None:
+            self.follow_pv = False
+        tt_move = entry.move if entry is not None else None
+        candidates = self.move_order.order(candidates, role, ply, tt_move, pv_move)
+        # the helpers of a LazySMP start their root on different moves
+        if self.helper and depth == self.depth and len(candidates) > 0:
+            shift = self.helper % len(candidates)
+            candidates = candidates[shift:] + candidates[:shift]
+
+        # the values of the root candidates searched by the worker processes
+        values = None
+        if depth == self.depth and self.pool is not None:
+            values = self.pool.search(self, candidates, depth, role, last_point)
+            if values is None:
+                if self.pool is None:
+                    return self.negamax(depth, alpha, beta, role, last_point)
+                self.aborted = True
+                return 0
 
         iteration = 0
-        value = -99999
-        for point, new_pattern in candidates:
+        value = -utils.Score.WIN
+        best_move = None
+        for index, (point, _) in enumerate(candidates):
             x, y = point
-            self.board[x][y] = role
-            # print(iteration)
-            v_new = -self.negamax(depth - 1, -beta, -alpha, 3 - role, new_pattern, (x, y))
+            if values is not None:
+                v_new = values[index]
+            else:
+                self.evaluator.apply(point, role)
+                # print(iteration)
+                if index == 0:
+                    v_new = -self.negamax(depth - 1, -beta, -alpha, 3 - role, (x, y))
+                else:
+                    # principal variation search: a null window proves the move no better than alpha,
+                    # the full window is searched again only when it is
+                    v_new = -self.negamax(depth - 1, -alpha - 1, -alpha, 3 - role, (x, y))
+                    if alpha < v_new < beta and not self.aborted:
+                        v_new = -self.negamax(depth - 1, -beta, -alpha, 3 - role, (x, y))
+                self.evaluator.undo()
+                # only the first child lies on the principal variation
+                self.follow_pv = False
+                if self.aborted:
+                    return 0
             if v_new > value:
                 value = v_new
-            self.board[x][y] = 0
+                best_move = point
             alpha_old =  alpha
             alpha = max(alpha, value)
 
             # do alpha_beta pruning
             if value > alpha_old:
-                if depth == self.max_depth:
+                if depth == self.depth:
                     self.move = (x, y)
             if alpha >= beta:
+                self.move_order.cutoff(point, role, ply, depth)
                 break
+
+        if value <= alpha_orig:
+            flag = "UPPER"
+        elif value >= beta:
+            flag = "LOWER"
+        else:
+            flag = "EXACT"
+        self.transposition_table.store(key, utils.Score.to_table(value, ply), depth, flag, best_move)
         return value
 
+    def principal_variation(self, depth):
+        '''
+        follow the best moves of the transposition table from the current position
+        :param depth: the most moves returned
+        :return: list of points, the expected moves of both sides
+        '''
+        pv = []
+        role = self.role
+        while len(pv) < depth:
+            entry = self.transposition_table.probe(self.board.hash ^ self.zobrist.side[role])
+            if entry is None or entry.move is None or self.board[entry.move[0]][entry.move[1]] != 0:
+                break
+            pv.append(entry.move)
+            self.board.place(entry.move[0], entry.move[1], role)
+            role = 3 - role
+        for point in reversed(pv):
+            self.board.remove(point[0], point[1])
+        return pv
+
     def get_key(self):
-        key = ""
-        for x in range(self.size):
-            for y in range(self.size):
-                if self.board[x][y]=="1":
-                    key += "1"
-                elif self.board[x][y]=="2":
-                    key += "2"
-                else:
-                    key += "0"
-        return key
+        '''
+        :return: zobrist key of the current board
+        '''
+        return self.board.hash
 
 
 board_initialize = [[0 for _ in range(20)] for _ in range(20)]
 board = MinMax(board_initialize)
-
-class TTEntry:
-    def __init__(self, value=0, depth=0, flag=""):
-        self.value = value
-        self.depth = depth
-        self.flag = flag
-
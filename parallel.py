@@ -0,0 +1,363 @@
+import concurrent.futures
+import multiprocessing
+import multiprocessing.shared_memory
+import os
+
+import minMax
+import utils
+
+# memory of one worker process: the interpreter, an engine and its transposition tables
+WORKER_MEMORY = 64 << 20
+# memory kept for the main process when info max_memory is set
+MAIN_MEMORY = 96 << 20
+# root candidates looked at for the kill checks and kept, as in MinMax.negamax
+KILL_CHECKS = 10
+KEEP = 3
+# slots of the transposition table LazySMP shares between the processes, 16 bytes each
+SHARED_SLOTS = 1 << 20
+
+# state of a worker process, set by init_worker
+worker = {}
+
+
+def init_worker(alpha, stop, shared=None, max_memory=0, weights=None):
+    '''
+    :param shared: (name, slots) of the shared memory holding the transposition table, a table of its own if None
+    :param max_memory: bytes the worker may use, 0 for no limit
+    :param weights: weights file of the main engine, see Score.load, None for the default weights
+    '''
+    worker["alpha"] = alpha
+    worker["weights"] = weights
+    worker["stop"] = stop
+    worker["engine"] = None
+    worker["cells"] = None
+    worker["governor"] = governor = utils.MemoryGovernor(max_memory)
+    if shared is None:
+        worker["transposition_table"] = utils.TranspositionTable(governor.slots(governor.SEARCH_SHARE))
+    else:
+        name, slots = shared
+        worker["memory"] = multiprocessing.shared_memory.SharedMemory(name)
+        worker["transposition_table"] = utils.TranspositionTable(slots, worker["memory"].buf)
+
+
+def available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def snapshot(engine, role, last_point):
+    '''
+    compact copy of the position for the workers
+    :return: (board size, bytes of the squares row by row, side to move, last move)
+    '''
+    cells = bytes(cell for row in engine.board for cell in row)
+    return engine.size, cells, role, last_point
+
+
+def worker_engine(position):
+    '''
+    the engine of the worker set up on the position, kept while the position stays the same
+    so that its transposition table serves the next iterations
+    '''
+    size, cells, role, last_point = position
+    if worker["cells"] != cells:
+        engine = minMax.MinMax([list(cells[x * size:(x + 1) * size]) for x in range(size)])
+        engine.transposition_table = worker["transposition_table"]
+        # the entries of the earlier positions go first, as in MinMax.min_max; helper_task sets the age
+        # of a shared table to the one of the main search
+        if not engine.transposition_table.shared:
+            engine.transposition_table.new_search()
+        engine.governor = worker["governor"]
+        engine.governor.size(engine)
+        if worker["weights"] is not None:
+            engine.Score.load(worker["weights"])
+        worker["engine"] = engine
+        worker["cells"] = cells
+    engine = worker["engine"]
+    engine.role = role
+    engine.last_point = last_point
+    return engine
+
+
+def worker_timer(remaining):
+    '''
+    :param remaining: milliseconds left to the main search, None without a time limit
+    '''
+    stop = worker["stop"]
+    if remaining is None:
+        return utils.Timer(float("inf"), float("inf"), stop=lambda: stop.value)
+    return utils.Timer(remaining, float("inf"), stop=lambda: stop.value, margin=0)
+
+
+def kill_task(position, point, remaining):
+    '''
+    :return: (True if the opponent wins by force after point, kill nodes)
+    '''
+    engine = worker_engine(position)
+    _, _, role, _ = position
+    engine.Kill.timer = worker_timer(remaining)
+    engine.evaluator.apply(point, role)
+    killed = engine.Kill.kill(3 - role, point)
+    engine.evaluator.undo()
+    engine.Kill.timer = None
+    return killed, engine.Kill.nodes
+
+
+def search_task(position, point, depth, remaining):
+    '''
+    search the reply to point, the window starts at the best value of the root found so far
+    :return: (value of point, False if the time was up, nodes, kill nodes)
+    '''
+    engine = worker_engine(position)
+    _, _, role, _ = position
+    alpha = worker["alpha"]
+    engine.timer = engine.Kill.timer = worker_timer(remaining)
+    engine.aborted = False
+    engine.nodes = engine.kill_nodes = 0
+    # the children are no root for negamax
+    engine.depth = depth
+    engine.evaluator.apply(point, role)
+    value = -engine.negamax(depth - 1, -float("inf"), -alpha.value, 3 - role, point)
+    engine.evaluator.undo()
+    engine.timer = engine.Kill.timer = None
+    if not engine.aborted:
+        with alpha.get_lock():
+            alpha.value = max(alpha.value, value)
+    return value, not engine.aborted, engine.nodes, engine.kill_nodes
+
+
+def helper_task(position, helper, age, remaining, depth_limit):
+    '''
+    iterative deepening on the position of the main search until it stops, for the transposition table only
+    :param helper: index of the helper from 1, odd ones start one iteration deeper than the main search
+    :param age: age of the entries of the main search
+    :return: (nodes, kill nodes)
+    '''
+    engine = worker_engine(position)
+    _, _, role, last_point = position
+    engine.transposition_table.age = age
+    engine.timer = engine.Kill.timer = worker_timer(remaining)
+    engine.aborted = False
+    engine.nodes = engine.kill_nodes = 0
+    engine.helper = helper
+    for depth in range(1 + helper % 2, depth_limit + 1):
+        engine.depth = depth
+        engine.negamax(depth, -float("inf"), float("inf"), role, last_point)
+        if engine.aborted:
+            break
+    engine.timer = engine.Kill.timer = None
+    return engine.nodes, engine.kill_nodes
+
+
+class RootPool:
+    '''
+    worker processes sharing the root of MinMax.negamax: the kill checks of the root candidates
+    run side by side, then the first candidate is searched alone and the others side by side
+    with the value of the first as their lower bound, shared through shared memory
+    '''
+
+    def __init__(self, workers, max_memory=0, weights=None):
+        '''
+        :param workers: number of processes
+        :param max_memory: bytes every worker may use, 0 for no limit
+        :param weights: weights file of the main engine, None for the default weights
+        '''
+        context = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.alpha = context.Value("d", -float("inf"))
+        self.stop = context.Value("b", 0)
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=context, initializer=init_worker, initargs=(self.alpha, self.stop, None, max_memory, weights))
+
+    @staticmethod
+    def workers_for(max_memory, cores=None):
+        '''
+        :param max_memory: info max_memory in bytes, 0 for no limit
+        :param cores: available cores, all of them when None
+        :return: number of worker processes that fit
+        '''
+        if cores is None:
+            cores = available_cores()
+        if max_memory:
+            return max(min(cores, (max_memory - MAIN_MEMORY) // WORKER_MEMORY), 0)
+        return cores
+
+    @staticmethod
+    def create(max_memory, cores=None, weights=None):
+        '''
+        :return: a RootPool, or None if there are not 2 workers to gain from
+        '''
+        workers = RootPool.workers_for(max_memory, cores)
+        if workers < 2:
+            return None
+        return RootPool(workers, WORKER_MEMORY if max_memory else 0, weights)
+
+    def close(self):
+        self.stop.value = 1
+        self.executor.shutdown(cancel_futures=True)
+
+    def remaining(self, engine):
+        if engine.timer is None:
+            return None
+        return max(engine.timer.budget - engine.timer.elapsed(), 0)
+
+    def run(self, engine, task, calls):
+        '''
+        run task in the workers once for every tuple of arguments of calls, the workers are told to stop
+        when the time of the engine is up
+        if a worker fails, killed for memory for example, the pool is closed and taken from the engine,
+        which searches alone from then on
+        :return: the results in order, None if the time was up or the pool failed (engine.pool is None then)
+        '''
+        try:
+            futures = [self.executor.submit(task, *args) for args in calls]
+            pending = set(futures)
+            while pending:
+                _, pending = concurrent.futures.wait(pending, timeout=0.01)
+                if engine.timer is not None and engine.timer.is_up():
+                    self.stop.value = 1
+                if engine.report is not None:
+                    engine.progress()
+            if self.stop.value:
+                return None
+            return [future.result() for future in futures]
+        except Exception:
+            self.close()
+            engine.pool = None
+            return None
+
+    def safe_moves(self, engine, free, role, last_point):
+        '''
+        the first KEEP candidates after which the opponent has no forced win
+        :param free: candidates of Board.candidates, best first
+        :return: list of candidates, None if the time was up or the pool failed
+        '''
+        self.stop.value = 0
+        position = snapshot(engine, role, last_point)
+        safe = []
+        checked = free[:KILL_CHECKS]
+        # one candidate per worker at a time, later ones are only checked while fewer than KEEP are safe
+        for start in range(0, len(checked), self.workers):
+            batch = checked[start:start + self.workers]
+            results = self.run(engine, kill_task, [(position, point, self.remaining(engine)) for point, _ in batch])
+            if results is None:
+                return None
+            engine.kill_nodes += sum(nodes for _, nodes in results)
+            safe += [candidate for candidate, (killed, _) in zip(batch, results) if not killed]
+            if len(safe) >= KEEP:
+                break
+        return safe[:KEEP]
+
+    def search(self, engine, candidates, depth, role, last_point):
+        '''
+        :param candidates: the root candidates, in the order they are to be searched
+        :return: list of the values of the candidates, None if the time was up or the pool failed
+        '''
+        self.stop.value = 0
+        self.alpha.value = -float("inf")
+        position = snapshot(engine, role, last_point)
+        values = []
+        # the first candidate alone gives the bound of the others
+        for group in (candidates[:1], candidates[1:]):
+            results = self.run(engine, search_task, [(position, point, depth, self.remaining(engine))
+                                                     for point, _ in group])
+            if results is None or not all(finished for _, finished, _, _ in results):
+                return None
+            for value, _, nodes, kill_nodes in results:
+                values.append(value)
+                engine.nodes += nodes
+                engine.kill_nodes += kill_nodes
+        return values
+
+
+class LazySMP:
+    '''
+    helper processes searching the same position as the main search, each with its own iterations and
+    root move order, and sharing its transposition table through shared memory: the main search
+    gains from the values and best moves they store, no result is sent back
+    '''
+
+    def __init__(self, workers, slots=SHARED_SLOTS, max_memory=0, weights=None):
+        '''
+        :param workers: number of helper processes
+        :param slots: size of the shared transposition table
+        :param max_memory: bytes every helper may use besides the shared table, 0 for no limit
+        :param weights: weights file of the main engine, None for the default weights
+        '''
+        context = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.stop = context.Value("b", 0)
+        self.memory = multiprocessing.shared_memory.SharedMemory(create=True, size=slots * utils.TranspositionTable.SLOT)
+        self.table = utils.TranspositionTable(slots, self.memory.buf)
+        self.table.clear()
+        self.futures = []
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=context, initializer=init_worker,
+            initargs=(None, self.stop, (self.memory.name, slots), max_memory, weights))
+
+    @staticmethod
+    def create(max_memory, cores=None, weights=None):
+        '''
+        :param max_memory: info max_memory in bytes, 0 for no limit
+        :param cores: available cores, all of them when None
+        :param weights: weights file of the main engine, None for the default weights
+        :return: a LazySMP with a helper for every core but the one of the main search, None without any
+        '''
+        if cores is None:
+            cores = available_cores()
+        table = SHARED_SLOTS * utils.TranspositionTable.SLOT
+        workers = RootPool.workers_for(max_memory and max_memory - table, cores - 1)
+        if workers < 1:
+            return None
+        return LazySMP(workers, max_memory=WORKER_MEMORY if max_memory else 0, weights=weights)
+
+    def attach(self, engine):
+        '''
+        the engine searches with the helpers and the shared table from now on
+        '''
+        engine.helpers = self
+        engine.transposition_table = self.table
+
+    def detach(self, engine):
+        '''
+        close the helpers, the engine searches alone with a table of its own again
+        '''
+        self.close()
+        engine.helpers = None
+        engine.transposition_table = utils.TranspositionTable(engine.governor.slots(engine.governor.SEARCH_SHARE))
+
+    def close(self):
+        self.stop.value = 1
+        self.executor.shutdown(cancel_futures=True)
+        # the views of the table would keep the shared memory from closing
+        self.table.release()
+        self.memory.close()
+        self.memory.unlink()
+
+    def start(self, engine, depth_limit):
+        '''
+        the helpers search the position of the engine until finish
+        :param depth_limit: the deepest iteration of the main search
+        '''
+        self.stop.value = 0
+        position = snapshot(engine, engine.role, engine.last_point)
+        remaining = None if engine.timer is None else max(engine.timer.budget - engine.timer.elapsed(), 0)
+        try:
+            self.futures = [self.executor.submit(helper_task, position, helper + 1, self.table.age, remaining, depth_limit)
+                            for helper in range(self.workers)]
+        except Exception:
+            self.detach(engine)
+
+    def finish(self, engine):
+        '''
+        stop the helpers once the main search is over, their nodes count in the ones of the engine
+        if a helper failed, they are detached from the engine, the move of the main search stands
+        '''
+        self.stop.value = 1
+        futures, self.futures = self.futures, []
+        try:
+            for future in futures:
+                nodes, kill_nodes = future.result()
+                engine.nodes += nodes
+                engine.kill_nodes += kill_nodes
+        except Exception:
+            self.detach(engine)
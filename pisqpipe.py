@@ -2,15 +2,14 @@
 # don't modify this file
 
 import sys
-import win32api
-import win32event
-import win32console
-import win32process
-import pywintypes
+import threading
+import time
+import queue
 
 DEBUG = False
 ABOUT_FUNC = True
-DEBUG_EVAL = True
+"""brain_eval of example.py draws in the manager window, which needs pywin32"""
+DEBUG_EVAL = False
 
 # information about a game - you should use these variables
 """the board size"""
@@ -31,7 +30,13 @@ info_exact5 = 0
 info_renju = 0
 """0: single game, 1: continuous"""
 info_continuous = 0
-"""return from brain_turn when terminateAI > 0"""
+"""1: think on the opponent's time after playing a move (INFO ponder 0 to switch off)"""
+info_ponder = 1
+"""1: report where the time of every move goes (INFO profile 1), see profiler.py"""
+info_profile = 0
+"""milliseconds between the MESSAGE lines on the progress of a search (INFO telemetry), 0 to switch them off"""
+info_telemetry = 1000
+"""return from brain_turn when terminateAI > 0, 1: without a move, 2 (STOP command): after playing the best move found so far"""
 terminateAI = None
 """tick count at the beginning of turn"""
 start_time = None
@@ -39,6 +44,11 @@ start_time = None
 dataFolder = ""
 
 event1, event2 = None, None
+"""lines read from sys.stdin by the reader thread, None at the end of input"""
+lines = queue.Queue()
+pipe_lock = threading.Lock()
+"""lines of telemetryOut waiting for the writer thread, the newest ones are dropped when it falls behind"""
+telemetry = queue.Queue(64)
 
 # you have to implement these functions
 def brain_init():
@@ -59,6 +69,16 @@ def brain_opponents(x, y):
 def brain_block(x, y):
 	"""square [x,y] belongs to a winning line (when info_continuous is 1)"""
 	raise NotImplementedError
+def brain_board(stones):
+	"""set up the position of the BOARD command, stones: list of (x, y, who), who 1: own, 2: opponent, 3: winning line
+	this one puts the stones one by one, replace it to load the whole position at once"""
+	for x, y, who in stones:
+		if who == 1:
+			brain_my(x, y)
+		elif who == 2:
+			brain_opponents(x, y)
+		else:
+			brain_block(x, y)
 def brain_takeback(x, y):
 	"""clear one square, return value: 0: success, 1: not supported, 2: error"""
 	raise NotImplementedError
@@ -73,13 +93,32 @@ infotext = ""
 def brain_about():
 	"""call pipeOut(" your AI info ")"""
 	raise NotImplementedError
+def brain_ponder():
+	"""think on the opponent's time until terminateAI > 0, the board must be as before when returning"""
+	pass
 
 
 def pipeOut(what):
-	"""write a line to sys.stdout"""
-	ret = len(what)
-	print(what)
-	sys.stdout.flush()
+	"""write a line to sys.stdout, from the main or the thinking thread"""
+	with pipe_lock:
+		print(what)
+		sys.stdout.flush()
+
+def telemetryOut(what):
+	"""write a line from the thinking thread without ever waiting for sys.stdout"""
+	try:
+		telemetry.put_nowait(what)
+	except queue.Full:
+		pass
+
+def writeLoop():
+	"""main function for the writer thread of telemetryOut"""
+	while True:
+		pipeOut(telemetry.get())
+
+def get_tick():
+	"""milliseconds from an arbitrary start, like GetTickCount"""
+	return int(time.monotonic() * 1000)
 
 def do_mymove(x, y):
 	brain_my(x, y)
@@ -89,17 +128,27 @@ def suggest(x, y):
 	"""send suggest"""
 	pipeOut("SUGGEST {},{}".format(x,y))
 
-def safeInt(v):
-	"""helper function for parsing strings to int"""
+def safeInt(v, default=None):
+	"""helper function for parsing strings to int, default when v is not a number"""
 	try:
 		ret = int(v)
 		return ret
 	except:
-		return None
+		return default
+
+def readLoop():
+	"""main function for the reader thread, so that the main thread never blocks on the pipe itself"""
+	for line in sys.stdin:
+		lines.put(line)
+	lines.put(None)
 
 def get_line():
-	"""read a line from sys.stdin"""
-	return sys.stdin.readline().strip()
+	"""read a line from sys.stdin, "END" when the manager closed the pipe"""
+	line = lines.get()
+	if line is None:
+		lines.put(None)
+		return "END"
+	return line.strip()
 
 def parse_coord(param):
 	"""parse coordinates x,y"""
@@ -136,26 +185,34 @@ def get_cmd_param(command, input):
 def threadLoop():
 	"""main function for the working thread"""
 	while True:
-		win32event.WaitForSingleObject(event1, win32event.INFINITE)
-		brain_turn()
-		win32event.SetEvent(event2)
+		event1.wait()
+		event1.clear()
+		try:
+			brain_turn()
+			if info_ponder and terminateAI == 0:
+				brain_ponder()
+		except Exception as e:
+			# the thread goes on, the manager hears of the error instead of waiting for a move forever
+			pipeOut("ERROR {}: {}".format(type(e).__name__, e))
+		finally:
+			event2.set()
 
 def turn():
 	"""start thinking"""
 	global terminateAI
 	terminateAI = 0
-	win32event.ResetEvent(event2)
-	win32event.SetEvent(event1)
+	event2.clear()
+	event1.set()
 
 def stop():
 	"""stop thinking"""
 	global terminateAI
 	terminateAI = 1
-	win32event.WaitForSingleObject(event2, win32event.INFINITE)
+	event2.wait()
 
 def start():
 	global start_time
-	start_time = win32api.GetTickCount()
+	start_time = get_tick()
 	stop()
 	global width, height
 	if not width:
@@ -164,42 +221,58 @@ def start():
 
 def do_command(cmd):
 	"""do command cmd"""
-	global info_max_memory, info_timeout_match, info_timeout_turn, info_time_left, info_game_type, info_exact5, info_continuous, info_renju, dataFolder
-	global width, height
+	global info_max_memory, info_timeout_match, info_timeout_turn, info_time_left, info_game_type, info_exact5, info_continuous, info_renju, info_ponder, info_profile, info_telemetry, dataFolder
+	global width, height, terminateAI
 	#
 	param = get_cmd_param("info", cmd)
 	if param is not None:
 		info = get_cmd_param("max_memory", param)
 		if info is not None:
-			info_max_memory = int(info)
+			info_max_memory = safeInt(info, info_max_memory)
 			return
 		#
 		info = get_cmd_param("timeout_match", param)
 		if info is not None:
-			info_timeout_match = int(info)
+			info_timeout_match = safeInt(info, info_timeout_match)
 			return
 		#
 		info = get_cmd_param("timeout_turn", param)
 		if info is not None:
-			info_timeout_turn = int(info)
+			info_timeout_turn = safeInt(info, info_timeout_turn)
 			return
 		#
 		info = get_cmd_param("time_left", param)
 		if info is not None:
-			info_time_left = int(info)
+			info_time_left = safeInt(info, info_time_left)
 			return
 		#
 		info = get_cmd_param("game_type", param)
 		if info is not None:
-			info_game_type = int(info)
+			info_game_type = safeInt(info, info_game_type)
 			return
 		#
 		info = get_cmd_param("rule", param)
 		if info is not None:
-			e = int(info)
-			info_exact5 = e & 1
-			info_continuous = (e >> 1) & 1
-			info_renju = (e >> 2) & 1
+			e = safeInt(info)
+			if e is not None:
+				info_exact5 = e & 1
+				info_continuous = (e >> 1) & 1
+				info_renju = (e >> 2) & 1
+			return
+		#
+		info = get_cmd_param("ponder", param)
+		if info is not None:
+			info_ponder = safeInt(info, info_ponder)
+			return
+		#
+		info = get_cmd_param("profile", param)
+		if info is not None:
+			info_profile = safeInt(info, info_profile)
+			return
+		#
+		info = get_cmd_param("telemetry", param)
+		if info is not None:
+			info_telemetry = max(safeInt(info, info_telemetry), 0)
 			return
 		#
 		info = get_cmd_param("folder", param)
@@ -291,22 +364,27 @@ def do_command(cmd):
 		sys.exit(0)
 		return
 	#
+	param = get_cmd_param("stop", cmd)
+	if param is not None:
+		# the thinking thread plays the best move found so far
+		if not event2.is_set():
+			terminateAI = 2
+		return
+	#
 	param = get_cmd_param("board", cmd)
 	if param is not None:
 		start()
+		stones = []
 		while True: # fill the whole board
 			cmd = get_line()
 			x,y,who = parse_3int_chk(cmd)
-			if who == 1:
-				brain_my(x, y)
-			elif who == 2:
-				brain_opponents(x, y)
-			elif who == 3:
-				brain_block(x, y)
+			if who in (1, 2, 3):
+				stones.append((x, y, who))
 			else:
 				if cmd.lower() != "done":
 					pipeOut("ERROR x,y,who or DONE expected after BOARD")
 				break
+		brain_board(stones)
 		turn()
 		return
 	#
@@ -329,17 +407,16 @@ def do_command(cmd):
 def main():
 	"""main function for AI console application"""
 	#
-	handle = win32console.GetStdHandle(win32console.STD_INPUT_HANDLE)
-	try:
-		if handle.GetConsoleMode():
-			pipeOut("MESSAGE Gomoku AI should not be started directly. Please install gomoku manager (http://sourceforge.net/projects/piskvork). Then enter path to this exe file in players settings.")
-	except pywintypes.error:
-		pass
+	if sys.stdin.isatty():
+		pipeOut("MESSAGE Gomoku AI should not be started directly. Please install gomoku manager (http://sourceforge.net/projects/piskvork). Then enter path to this exe file in players settings.")
 	#
 	global event1, event2
-	event1 = win32event.CreateEvent(None, 0, 0, None)
-	win32process.beginthreadex(None, 0, threadLoop, (), 0)
-	event2 = win32event.CreateEvent(None, 1, 1, None)
+	event1 = threading.Event()
+	event2 = threading.Event()
+	event2.set()
+	threading.Thread(target=threadLoop, daemon=True).start()
+	threading.Thread(target=readLoop, daemon=True).start()
+	threading.Thread(target=writeLoop, daemon=True).start()
 	while True:
 		cmd = get_line()
 		do_command(cmd)
@@ -0,0 +1,156 @@
+import functools
+import json
+import time
+
+import minMax
+import utils
+
+# methods timed and counted, as (class, name); a method calling itself, or called again from inside itself,
+# is only timed from its outermost call
+HOT_PATHS = (
+    (minMax.MinMax, "negamax"),
+    (utils.Board, "candidates"),
+    (utils.Score, "batch_scores"),
+    (utils.Score, "total_score"),
+    (utils.Frontier, "delta"),
+    (utils.Pattern, "delta"),
+    (utils.Pattern, "get_total_pattern"),
+    (utils.ArrayPattern, "get_total_pattern"),
+    (utils.Evaluator, "apply"),
+    (utils.Evaluator, "undo"),
+    (utils.Kill, "kill"),
+    (utils.Kill, "killer"),
+    (utils.Kill, "defend"),
+    (utils.TranspositionTable, "probe"),
+    (utils.MoveOrder, "cutoff"),
+)
+
+
+def label(path):
+    cls, name = path
+    return "{}.{}".format(cls.__name__, name)
+
+
+class Profiler:
+    '''
+    counts and times the hot paths of the search by wrapping their methods while it is enabled,
+    so that the engine runs its plain methods, without any overhead, when it is not
+    only the process it runs in is measured, not the worker processes of parallel.py
+    '''
+
+    def __init__(self, paths=HOT_PATHS):
+        '''
+        :param paths: the methods to measure, see HOT_PATHS
+        '''
+        self.paths = paths
+        self.calls = {label(path): 0 for path in paths}
+        self.seconds = {label(path): 0.0 for path in paths}
+        # how deep every method is in its own calls, only the outermost one is timed
+        self.active = {label(path): 0 for path in paths}
+        # probes of the transposition tables that found their position
+        self.hits = 0
+        self.original = []
+        # summary of every move, see end_move
+        self.moves = []
+        self.start = None
+
+    def enable(self):
+        for cls, name in self.paths:
+            method = cls.__dict__[name]
+            self.original.append((cls, name, method))
+            setattr(cls, name, self.wrap(label((cls, name)), method))
+
+    def disable(self):
+        for cls, name, method in reversed(self.original):
+            setattr(cls, name, method)
+        self.original = []
+
+    def wrap(self, name, method):
+        calls, seconds, active = self.calls, self.seconds, self.active
+        clock = time.perf_counter
+        is_probe = name == "TranspositionTable.probe"
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            if active[name]:
+                return method(*args, **kwargs)
+            active[name] = 1
+            start = clock()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                seconds[name] += clock() - start
+                active[name] = 0
+            if is_probe and result is not None:
+                self.hits += 1
+            return result
+
+        return wrapper
+
+    def counters(self):
+        return dict(self.calls), dict(self.seconds), self.hits
+
+    def start_move(self):
+        self.start = (time.perf_counter(),) + self.counters()
+
+    def end_move(self, engine):
+        '''
+        :param engine: the minMax.MinMax that searched the move
+        :return: the summary of the move since start_move, also kept in self.moves
+        '''
+        start, calls, seconds, hits = self.start
+        move = self.summary(time.perf_counter() - start,
+                            {name: self.calls[name] - calls[name] for name in calls},
+                            {name: self.seconds[name] - seconds[name] for name in seconds},
+                            self.hits - hits)
+        # the deepest finished iteration, the last one started may have run out of time
+        move.update(depth=engine.finished, nodes=engine.nodes, kill_nodes=engine.kill_nodes)
+        self.moves.append(move)
+        return move
+
+    def summary(self, elapsed, calls, seconds, hits):
+        return {
+            "time": elapsed,
+            "cutoffs": calls["MoveOrder.cutoff"],
+            "tt_probes": calls["TranspositionTable.probe"],
+            "tt_hits": hits,
+            "paths": {name: {"calls": calls[name], "seconds": seconds[name]} for name in calls if calls[name] > 0},
+        }
+
+    def total(self):
+        '''
+        :return: the summaries of all the moves added up, the searches on the opponent's time are left out
+        '''
+        total = {"time": 0.0, "cutoffs": 0, "tt_probes": 0, "tt_hits": 0, "nodes": 0, "kill_nodes": 0, "paths": dict()}
+        for move in self.moves:
+            for name in ("time", "cutoffs", "tt_probes", "tt_hits", "nodes", "kill_nodes"):
+                total[name] += move[name]
+            for name, path in move["paths"].items():
+                sums = total["paths"].setdefault(name, {"calls": 0, "seconds": 0.0})
+                sums["calls"] += path["calls"]
+                sums["seconds"] += path["seconds"]
+        total["moves"] = len(self.moves)
+        return total
+
+    @staticmethod
+    def lines(title, summary):
+        '''
+        :return: the summary as text lines, the hot paths by time spent
+        '''
+        elapsed = max(summary["time"], 1e-9)
+        nodes = summary["nodes"] + summary["kill_nodes"]
+        head = "{}: {:.3f} s, {}nodes {}, kill nodes {}, {:.0f} nps, cutoffs {}, tt hits {}/{}".format(
+            title, summary["time"], "depth {}, ".format(summary["depth"]) if "depth" in summary else "",
+            summary["nodes"], summary["kill_nodes"], nodes / elapsed, summary["cutoffs"],
+            summary["tt_hits"], summary["tt_probes"])
+        paths = sorted(summary["paths"].items(), key=lambda item: item[1]["seconds"], reverse=True)
+        return [head] + ["  {:<30} {:>9.3f} s {:>5.1f}% {:>9} calls".format(
+            name, path["seconds"], path["seconds"] / elapsed * 100, path["calls"]) for name, path in paths]
+
+    def write(self, path):
+        '''
+        the summaries of every move and their total as json
+        '''
+        with open(path, "w") as f:
+            f.write(json.dumps({"moves": self.moves, "total": self.total()}, indent=2) + "\n")
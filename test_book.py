@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+import book
+import utils
+
+SIZE = 15
+
+
+def random_rows(seed, stones):
+    '''
+    :return: board as a list of rows, stones of both roles in turn on random squares
+    '''
+    rng = random.Random(seed)
+    rows = [[0] * SIZE for _ in range(SIZE)]
+    for index, (x, y) in enumerate(rng.sample([(x, y) for x in range(SIZE) for y in range(SIZE)], stones)):
+        rows[x][y] = 1 + index % 2
+    return rows
+
+
+def transformed(rows, symmetry):
+    result = [[0] * SIZE for _ in range(SIZE)]
+    for x in range(SIZE):
+        for y in range(SIZE):
+            i, j = book.transform((x, y), symmetry, SIZE)
+            result[i][j] = rows[x][y]
+    return result
+
+
+def swapped(rows):
+    return [[{1: 2, 2: 1}.get(cell, cell) for cell in row] for row in rows]
+
+
+@pytest.mark.parametrize("symmetry", range(8))
+def test_inverse_undoes_transform(symmetry):
+    points = [(x, y) for x in range(SIZE) for y in range(SIZE)]
+    images = [book.transform(point, symmetry, SIZE) for point in points]
+    assert sorted(images) == points
+    assert [book.inverse(image, symmetry, SIZE) for image in images] == points
+
+
+def test_symmetries_differ():
+    assert len({book.transform((1, 4), symmetry, SIZE) for symmetry in range(8)}) == 8
+
+
+def test_canonical_key_of_the_symmetries_and_colours():
+    zobrist = utils.Zobrist(SIZE)
+    for seed in range(5):
+        rows = random_rows(seed, 9)
+        key, _ = book.canonical(rows, 1, zobrist)
+        for symmetry in range(8):
+            assert book.canonical(transformed(rows, symmetry), 1, zobrist)[0] == key
+            assert book.canonical(swapped(transformed(rows, symmetry)), 2, zobrist)[0] == key
+        assert book.canonical(rows, 2, zobrist)[0] != key
+
+
+def test_probe_maps_the_move_back(tmp_path):
+    zobrist = utils.Zobrist(SIZE)
+    rows = random_rows(1, 7)
+    move = next((x, y) for x in range(SIZE) for y in range(SIZE) if rows[x][y] == 0)
+    key, symmetry = book.canonical(rows, 2, zobrist)
+    x, y = book.transform(move, symmetry, SIZE)
+    other = next(point for point in [(0, 1), (1, 0), (1, 1)] if point != (x, y))
+    path = str(tmp_path / book.BOOK_FILE)
+    # the move played most in the position is the one of the book
+    book.Book.write(path, SIZE, {(key, x * SIZE + y): 5, (key, other[0] * SIZE + other[1]): 2, (key + 1, 0): 9})
+    opened = book.Book.open(path)
+    try:
+        assert opened.count == 3
+        for symmetry in range(8):
+            assert opened.probe(transformed(rows, symmetry), 2) == book.transform(move, symmetry, SIZE)
+            assert opened.probe(swapped(transformed(rows, symmetry)), 1) == book.transform(move, symmetry, SIZE)
+        assert opened.probe(random_rows(2, 7), 2) is None
+        assert opened.probe([[0] * 9 for _ in range(9)], 1) is None
+    finally:
+        opened.close()
+
+
+def test_open_without_a_book(tmp_path):
+    path = tmp_path / book.BOOK_FILE
+    assert book.Book.open(str(path)) is None
+    path.write_bytes(b"not a book")
+    assert book.Book.open(str(path)) is None
@@ -0,0 +1,56 @@
+import shlex
+import sys
+
+import pytest
+
+import match
+
+
+@pytest.mark.parametrize("difference", [-300, -10, 0, 35, 400])
+def test_elo_of_the_score_of_an_elo_difference(difference):
+    assert match.elo(match.score_of(difference)) == pytest.approx(difference)
+
+
+def test_elo_of_a_whole_score_is_finite():
+    assert match.elo(0.5) == 0
+    assert -float("inf") < match.elo(0) < -2000
+    assert 2000 < match.elo(1) < float("inf")
+
+
+def test_sprt_without_variance():
+    assert match.sprt(0, 0, 0, -10, 0) == 0
+    assert match.sprt(12, 0, 0, -10, 0) == 0
+    assert match.sprt(0, 7, 0, -10, 0) == 0
+
+
+def test_sprt_leans_to_the_hypothesis_of_the_results():
+    assert match.sprt(60, 20, 40, -10, 0) > 0
+    assert match.sprt(40, 20, 60, -10, 0) < 0
+    # more games of the same results give more evidence
+    assert match.sprt(120, 40, 80, -10, 0) == pytest.approx(2 * match.sprt(60, 20, 40, -10, 0))
+
+
+def test_sprt_of_the_other_player():
+    # the results of the other player against the hypotheses seen from its side
+    assert match.sprt(30, 25, 45, -10, 5) == pytest.approx(-match.sprt(45, 25, 30, -5, 10))
+
+
+def test_summary():
+    assert match.summary(0, 0, 0) == (0, float("inf"))
+    difference, margin = match.summary(50, 0, 50)
+    assert difference == 0 and margin > 0
+    better, _ = match.summary(60, 10, 30)
+    worse, _ = match.summary(30, 10, 60)
+    assert better == pytest.approx(-worse) and better > 0
+    # the interval narrows with the games
+    assert match.summary(200, 0, 200)[1] < margin
+
+
+def test_player_that_does_not_start_loses():
+    # a brain that ends without answering START
+    spec = "cmd:" + " ".join(shlex.quote(part) for part in (sys.executable, "-c", "pass"))
+    score, stones, end = match.play_game("engine", spec, [(9, 9)], 20, 100, 1)
+    assert (score, stones) == (1, 1)
+    assert end.startswith("player 2 failed")
+    score, _, end = match.play_game("engine:no_such_attribute=1", "engine", [], 20, 100, 1)
+    assert score == 0 and end.startswith("player 1 failed")
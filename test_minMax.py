@@ -0,0 +1,154 @@
+import random
+
+import minMax
+import utils
+
+SIZE = 15
+
+
+def engine():
+    return minMax.MinMax([[0] * SIZE for _ in range(SIZE)], False)
+
+
+def random_game(seed, length):
+    '''
+    :return: list of ((x,y), role) of a game played in turn near the middle of the board
+    '''
+    rng = random.Random(seed)
+    moves = []
+    taken = set()
+    role = 1
+    while len(moves) < length:
+        point = (rng.randrange(4, SIZE - 4), rng.randrange(4, SIZE - 4))
+        if point not in taken:
+            taken.add(point)
+            moves.append((point, role))
+            role = 3 - role
+    return moves
+
+
+def assert_pattern_of_board(engine):
+    assert engine.pattern == engine.Pattern.get_total_pattern(1)
+
+
+def test_load_position_matches_moves_played():
+    for seed in range(5, 8):
+        moves = random_game(seed, 30)
+        played = engine()
+        played.replay(moves)
+        loaded = engine()
+        loaded.load_position(moves)
+        assert loaded.pattern == played.pattern
+        assert_pattern_of_board(loaded)
+        assert (loaded.role, loaded.last_point) == (played.role, played.last_point)
+        played.max_depth = loaded.max_depth = 2
+        assert loaded.min_max() == played.min_max()
+
+
+def test_plays_the_five_at_once():
+    board = minMax.MinMax([[0] * 20 for _ in range(20)], False)
+    role = 1
+    for point in [(9, 9), (10, 10), (10, 8), (11, 9), (12, 6), (9, 11), (11, 7), (12, 12)]:
+        board[point] = role
+        role = 3 - role
+    # the open four of 1 makes five on either end, ranked far down the candidates
+    assert board.min_max() in [(8, 10), (13, 5)]
+    assert board.value == utils.Score.WIN - 1
+
+
+def test_iterative_deepening_to_the_depth_limit():
+    moves = random_game(1, 10)
+    fixed = engine()
+    fixed.replay(moves)
+    fixed.max_depth = 3
+    timed = engine()
+    timed.replay(moves)
+    timed.depth_limit = 3
+    # the same search as the fixed depth when the time is not up
+    assert timed.min_max(utils.Timer(10 ** 6, 10 ** 9)) == fixed.min_max()
+    assert (timed.finished, timed.value) == (3, fixed.value)
+
+
+def test_search_out_of_time_plays_a_candidate():
+    moves = random_game(1, 10)
+    board = engine()
+    board.replay(moves)
+    x, y = board.min_max(utils.Timer(10 ** 6, 10 ** 9, stop=lambda: True))
+    assert board.finished == 0 and board[x, y] == 0
+    # a small budget stops the deepening long before the depth limit
+    board.min_max(utils.Timer(500, 10 ** 9))
+    assert 1 <= board.finished < board.depth_limit
+
+
+def test_takeback_and_replay():
+    moves = random_game(7, 40)
+    board = engine()
+    board.replay(moves)
+    # a stone in the middle of the history, then the last move
+    for point, _ in (moves[8], moves[-1]):
+        board[point] = 0
+        assert_pattern_of_board(board)
+    board.replay([moves[8], moves[-1]])
+    assert_pattern_of_board(board)
+    board.takeback()
+    assert_pattern_of_board(board)
+    assert board[moves[-1][0]] == 0
+    # the replayed stone is the last move again
+    (x, y), role = moves[8]
+    assert (board.role, board.last_point) == (3 - role, (y, x))
+    # a stone in the middle, the moves after it are played again
+    board.takeback(moves[20][0])
+    assert_pattern_of_board(board)
+    assert board[moves[20][0]] == 0
+    assert (board.role, board.last_point) == (3 - role, (y, x))
+
+
+def test_takeback_of_the_only_move_after_a_loaded_position():
+    moves = random_game(4, 21)
+    board = engine()
+    board.load_position(moves[:20])
+    loaded = (board.role, board.last_point)
+    board.replay(moves[20:])
+    assert board.takeback()
+    assert_pattern_of_board(board)
+    assert (board.role, board.last_point) == loaded
+
+
+def test_takeback_outside_the_history():
+    moves = random_game(3, 40)
+    board = engine()
+    board.load_position([((0, 0), 3)] + moves[:20])
+    board.replay(moves[20:])
+    # the loaded stones have no history and go through the whole board search
+    board[moves[2][0]] = 0
+    assert_pattern_of_board(board)
+    board.replay([moves[2]])
+    assert_pattern_of_board(board)
+
+
+def test_restart_empties_the_board():
+    board = engine()
+    board[(2, 2)] = 3
+    board.replay(random_game(5, 10))
+    board.restart()
+    assert board.board.is_empty()
+    assert_pattern_of_board(board)
+    assert board.role == 1
+
+
+def test_governor_counts_the_line_table():
+    board = engine()
+    try:
+        board.set_max_memory(48 << 20)
+        assert utils.LINE_TABLE.limit == board.governor.lines() < utils.LineTable.DEFAULT_LIMIT
+        utils.LINE_TABLE.clear()
+        before = board.governor.live_bytes(board)
+        utils.line_table(0b10111011, 0b1000100, SIZE)
+        assert board.governor.live_bytes(board) == before + utils.LineTable.LINE
+        # over the limit the caches go first
+        board.governor.max_memory = before
+        board.governor.govern(board)
+        assert len(utils.LINE_TABLE) == 0
+    finally:
+        board.set_max_memory(0)
+    assert utils.LINE_TABLE.limit == utils.LineTable.DEFAULT_LIMIT
@@ -0,0 +1,52 @@
+import os
+import signal
+
+import pytest
+
+import bench
+import parallel
+
+DEPTH = 4
+
+
+@pytest.fixture(scope="module")
+def pool():
+    # two workers, whatever the cores of the machine
+    pool = parallel.RootPool(2)
+    yield pool
+    pool.close()
+
+
+def engine_of(position):
+    engine = bench.engine_of(position, bench.load_positions(bench.POSITIONS_FILE)["size"])
+    engine.max_depth = DEPTH
+    return engine
+
+
+@pytest.mark.parametrize("position", bench.load_positions(bench.POSITIONS_FILE)["positions"],
+                         ids=lambda position: position["name"])
+def test_root_pool_plays_the_move_of_the_search_alone(pool, position):
+    alone = engine_of(position)
+    shared = engine_of(position)
+    shared.pool = pool
+    assert shared.min_max() == alone.min_max()
+    assert shared.pool is pool
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_broken_pool_falls_back_to_the_search_alone():
+    position = bench.load_positions(bench.POSITIONS_FILE)["positions"][0]
+    pool = parallel.RootPool(2)
+    try:
+        # the workers start with the first task, then one of them is killed, for memory for example
+        pool.executor.submit(os.getpid).result()
+        process = next(iter(pool.executor._processes.values()))
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+        engine = engine_of(position)
+        engine.pool = pool
+        move = engine.min_max()
+        assert engine.pool is None
+        assert move == engine_of(position).min_max()
+    finally:
+        pool.close()
@@ -0,0 +1,115 @@
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+import pisqpipe as pp
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example.py")
+
+
+class Brain:
+    '''
+    example.py run as the manager runs it, its lines read by a thread
+    '''
+
+    def __init__(self):
+        env = dict(os.environ, PBRAIN_PARALLEL="off", PBRAIN_PROFILE="")
+        self.process = subprocess.Popen([sys.executable, EXAMPLE], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True, env=env)
+        self.lines = queue.Queue()
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        for line in self.process.stdout:
+            self.lines.put(line.strip())
+
+    def send(self, *commands):
+        for command in commands:
+            self.process.stdin.write(command + "\n")
+        self.process.stdin.flush()
+
+    def answer(self, timeout=20):
+        '''
+        :return: the next line that is not a MESSAGE or DEBUG line
+        '''
+        while True:
+            line = self.lines.get(timeout=timeout)
+            if not line.startswith(("MESSAGE", "DEBUG")):
+                return line
+
+    def end(self):
+        self.send("END")
+        return self.process.wait(timeout=20)
+
+
+def is_move(line, size=15):
+    x, y = line.split(",")
+    return 0 <= int(x) < size and 0 <= int(y) < size
+
+
+def test_bad_info_values():
+    brain = Brain()
+    try:
+        brain.send("INFO ponder x", "INFO profile y", "INFO telemetry z", "INFO timeout_turn abc",
+                   "INFO max_memory lots", "INFO rule -", "INFO timeout_turn 300", "START 15")
+        assert brain.answer() == "OK"
+        brain.send("BEGIN")
+        assert is_move(brain.answer())
+        brain.send("TURN 7,8")
+        assert is_move(brain.answer())
+    finally:
+        assert brain.end() == 0
+
+
+def test_stop_plays_the_best_move_so_far():
+    brain = Brain()
+    try:
+        brain.send("INFO timeout_turn 60000", "INFO time_left 1000000", "START 15",
+                   "BOARD", "7,7,2", "8,8,1", "7,8,2", "DONE")
+        assert brain.answer() == "OK"
+        brain.send("STOP")
+        assert is_move(brain.answer(timeout=10))
+    finally:
+        assert brain.end() == 0
+
+
+def test_thinking_thread_survives_an_error(monkeypatch, capsys):
+    def brain_turn():
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(pp, "brain_turn", brain_turn)
+    monkeypatch.setattr(pp, "info_ponder", 0)
+    monkeypatch.setattr(pp, "event1", threading.Event())
+    monkeypatch.setattr(pp, "event2", threading.Event())
+    pp.event2.set()
+    threading.Thread(target=pp.threadLoop, daemon=True).start()
+    for _ in range(2):
+        pp.turn()
+        assert pp.event2.wait(timeout=10)
+    assert capsys.readouterr().out.splitlines() == ["ERROR RuntimeError: broken"] * 2
+
+
+def test_moves_stay_on_a_small_board():
+    brain = Brain()
+    try:
+        brain.send("INFO timeout_turn 300", "RECTSTART 7,9")
+        assert brain.answer().startswith("ERROR")
+        brain.send("START 7")
+        assert brain.answer() == "OK"
+        brain.send("BEGIN")
+        assert is_move(brain.answer(), 7)
+        brain.send("TURN 0,0")
+        assert is_move(brain.answer(), 7)
+    finally:
+        assert brain.end() == 0
+
+
+def test_info_that_is_not_a_number_keeps_the_value(monkeypatch):
+    for name, value in (("info_ponder", 0), ("info_profile", 1), ("info_telemetry", 500), ("info_timeout_turn", 300)):
+        monkeypatch.setattr(pp, name, value)
+        pp.do_command("INFO {} x".format(name[5:]))
+        assert getattr(pp, name) == value
+    pp.do_command("INFO telemetry -20")
+    assert pp.info_telemetry == 0
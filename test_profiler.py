@@ -0,0 +1,80 @@
+import json
+import random
+
+import minMax
+import profiler
+
+SIZE = 15
+
+
+def engine_of_game(seed, length):
+    '''
+    :return: MinMax after a game of random moves in turn near the middle of the board
+    '''
+    rng = random.Random(seed)
+    engine = minMax.MinMax([[0] * SIZE for _ in range(SIZE)], False)
+    role = 1
+    while len(engine.evaluator.moves) < length:
+        point = (rng.randrange(4, SIZE - 4), rng.randrange(4, SIZE - 4))
+        if engine[point] == 0:
+            engine[point] = role
+            role = 3 - role
+    engine.max_depth = 3
+    return engine
+
+
+def test_disable_puts_the_methods_back():
+    methods = [cls.__dict__[name] for cls, name in profiler.HOT_PATHS]
+    profile = profiler.Profiler()
+    profile.enable()
+    try:
+        assert all(cls.__dict__[name] is not method for (cls, name), method in zip(profiler.HOT_PATHS, methods))
+    finally:
+        profile.disable()
+    assert all(cls.__dict__[name] is method for (cls, name), method in zip(profiler.HOT_PATHS, methods))
+
+
+def test_profile_of_a_move():
+    plain = engine_of_game(1, 10)
+    profiled = engine_of_game(1, 10)
+    profile = profiler.Profiler()
+    profile.enable()
+    try:
+        profile.start_move()
+        move = profiled.min_max()
+        summary = profile.end_move(profiled)
+    finally:
+        profile.disable()
+    # measuring changes nothing of the search
+    assert move == plain.min_max()
+    assert (summary["depth"], summary["nodes"], summary["kill_nodes"]) == (3, plain.nodes, plain.kill_nodes)
+    negamax = summary["paths"]["MinMax.negamax"]
+    assert negamax["calls"] > 0
+    # only the outermost of the calls of negamax to itself is timed
+    assert 0 < negamax["seconds"] <= summary["time"]
+    assert summary["tt_hits"] <= summary["tt_probes"]
+
+
+def test_total_and_report(tmp_path):
+    engine = engine_of_game(2, 10)
+    profile = profiler.Profiler()
+    profile.enable()
+    try:
+        for point in [(3, 3), (11, 11)]:
+            profile.start_move()
+            engine.min_max()
+            profile.end_move(engine)
+            engine[point] = engine.role
+    finally:
+        profile.disable()
+    total = profile.total()
+    assert total["moves"] == 2
+    assert total["nodes"] == sum(move["nodes"] for move in profile.moves)
+    assert total["paths"]["MinMax.negamax"]["calls"] == sum(
+        move["paths"]["MinMax.negamax"]["calls"] for move in profile.moves)
+    lines = profiler.Profiler.lines("profile", total)
+    assert lines[0].startswith("profile: ")
+    assert len(lines) == len(total["paths"]) + 1
+    path = tmp_path / "profile.json"
+    profile.write(str(path))
+    assert json.loads(path.read_text()) == json.loads(json.dumps({"moves": profile.moves, "total": total}))
@@ -0,0 +1,220 @@
+import json
+import os
+import random
+
+import pytest
+
+import utils
+
+SIZE = 15
+
+
+def board_of(stones, size=SIZE):
+    '''
+    :param stones: list of ((x,y), role) in the order of the rows of the board, board[x][y]
+    :return: BitBoard holding the stones
+    '''
+    rows = [[0] * size for _ in range(size)]
+    for (x, y), role in stones:
+        rows[x][y] = role
+    return utils.BitBoard(rows)
+
+
+def evaluator_of(board):
+    '''
+    :return: Evaluator of the board, starting from the pattern of the whole board search
+    '''
+    pattern = utils.Pattern(board).get_total_pattern(1)
+    return utils.Evaluator(board, pattern, utils.Frontier(board))
+
+
+def random_board(seed, stones, size=SIZE):
+    '''
+    :return: BitBoard with stones of both roles in turn and a few blocked squares on random squares
+    '''
+    rng = random.Random(seed)
+    points = rng.sample([(x, y) for x in range(size) for y in range(size)], stones + 3)
+    return board_of([(point, 3 if index < 3 else 1 + index % 2) for index, point in enumerate(points)], size)
+
+
+def board_of_rows(rows):
+    '''
+    :param rows: rows of "." empty, "x" role 1 and "o" role 2, as in bench_positions.json
+    '''
+    return board_of([((x, y), {"x": 1, "o": 2}[cell]) for x, row in enumerate(rows)
+                     for y, cell in enumerate(row) if cell != "."], len(rows))
+
+
+def test_dead_overline_is_five():
+    # o x x x x x x o: six stones of 1 closed at both ends
+    stones = [((7, 3), 2), ((7, 10), 2)] + [((7, y), 1) for y in range(4, 10)]
+    board = board_of(stones)
+    pattern = utils.Pattern(board).get_total_pattern(1)
+    assert pattern[1][utils.FIVE_INDEX] == 1
+    assert utils.Score(board).checkWinner(pattern) == 1
+
+
+def test_dead_overline_made_by_a_move_is_five():
+    stones = [((7, 3), 2), ((7, 10), 2)] + [((7, y), 1) for y in range(4, 10) if y != 6]
+    board = board_of(stones)
+    evaluator = evaluator_of(board)
+    evaluator.apply((7, 6), 1)
+    assert evaluator.pattern[1][utils.FIVE_INDEX] == 1
+    assert evaluator.pattern == utils.Pattern(board).get_total_pattern(1)
+
+
+def test_incremental_pattern_matches_whole_board_search():
+    for game in range(40):
+        rng = random.Random(game)
+        # a few blocked squares, as brain_block puts them
+        board = board_of([((rng.randrange(SIZE), rng.randrange(SIZE)), 3) for _ in range(3)])
+        whole = utils.Pattern(board)
+        evaluator = evaluator_of(board)
+        role = 1
+        for _ in range(rng.randint(20, 120)):
+            free = [(x, y) for x in range(SIZE) for y in range(SIZE) if board[x][y] == 0]
+            evaluator.apply(rng.choice(free), role)
+            role = 3 - role
+            assert evaluator.pattern == whole.get_total_pattern(1)
+        while evaluator.moves:
+            evaluator.undo()
+            assert evaluator.pattern == whole.get_total_pattern(1)
+
+
+def test_split_three_next_to_a_four():
+    # the row . . x o . o . o o o o . . played in this order, the split three of o once went stale
+    board = board_of([])
+    whole = utils.Pattern(board)
+    evaluator = evaluator_of(board)
+    for y, role in [(3, 2), (5, 2), (2, 1), (8, 2), (9, 2), (7, 2), (10, 2)]:
+        evaluator.apply((7, y), role)
+        assert evaluator.pattern == whole.get_total_pattern(1)
+
+
+def test_timer_budget():
+    # the turn, less the margin and the time to answer
+    assert utils.Timer(1000, 10 ** 9).budget == pytest.approx(1000 * 0.85 - 30)
+    # the time left shared by the moves left
+    assert utils.Timer(1000, 2500).budget == pytest.approx(100 * 0.85 - 30)
+    timer = utils.Timer(0, 10 ** 9)
+    assert timer.budget == 0 and timer.is_up() and not timer.can_deepen()
+
+
+def test_timer_stops_when_told():
+    stop = [False]
+    timer = utils.Timer(10 ** 6, 10 ** 9, stop=lambda: stop[0])
+    assert not timer.is_up() and timer.can_deepen()
+    stop[0] = True
+    assert timer.is_up() and not timer.can_deepen()
+
+
+def write_weights(tmp_path, config):
+    path = tmp_path / utils.Score.WEIGHTS_FILE
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_load_weights(tmp_path):
+    score = utils.Score(board_of([]))
+    score.load(write_weights(tmp_path, {"patterns": {"3,1,S": 200}, "five": 2e6, "opponent": 1.2}))
+    assert score.weights[utils.PATTERN_INDEX[(3, 1, "S")]] == 200
+    assert (score.five, score.opponent) == (2000000, 1.2)
+
+
+@pytest.mark.parametrize("config", [
+    {"five": 1e9},
+    {"patterns": {"4,2": 2e8}},
+    {"opponent": 1.33},
+    {"live3_bonus": 0.5},
+    {"patterns": {"6,2": 1}},
+    {"five": "many"},
+    {"five": True},
+    {"opponent": float("inf")},
+    {"five": float("nan")},
+    {"patterns": {"3,2": False}},
+    {"patterns": [1, 2]},
+    {"patterns": "3,2"},
+    [1, 2],
+])
+def test_load_rejects_weights_out_of_range(tmp_path, config):
+    score = utils.Score(board_of([]))
+    with pytest.raises(ValueError):
+        score.load(write_weights(tmp_path, config))
+    assert score.five == utils.Score.FIVE
+
+
+def test_evaluation_stays_below_the_wins():
+    # many open fours of 1 and none of 2
+    stones = [((x, y), 1) for x in range(1, 14, 2) for y in range(1, 5)]
+    score = utils.Score(board_of(stones))
+    score.set_weights({key: 10 ** 7 for key in utils.PATTERN_KEYS}, 10 ** 7, 0, 1.4)
+    pattern = utils.Pattern(score.board).get_total_pattern(1)
+    assert score.total_score(pattern, 1) == utils.Score.EVAL_BOUND
+    assert score.total_score(pattern, 2) == -utils.Score.EVAL_BOUND
+
+
+@pytest.mark.parametrize("value", [0, 1.4, -302.6, utils.Score.EVAL_BOUND, -utils.Score.EVAL_BOUND,
+                                   utils.Score.WIN + 100, -utils.Score.WIN - 100])
+def test_transposition_table_keeps_values(value):
+    table = utils.TranspositionTable(1 << 4)
+    table.store(12345, value, 7, "LOWER", (19, 3))
+    entry = table.probe(12345)
+    assert (entry.value, entry.depth, entry.flag, entry.move) == (value, 7, "LOWER", (19, 3))
+    # another position on the same slot
+    assert table.probe(12345 + (1 << 4)) is None
+
+
+def test_line_table_is_bounded():
+    limit = utils.LINE_TABLE.limit
+    try:
+        utils.LINE_TABLE.limit = 64
+        # lines blocked past their end, met by no other test
+        for own in range(1, 200):
+            utils.line_table(own, 1 << SIZE, SIZE)
+            assert len(utils.LINE_TABLE) <= 64
+        # the oldest lines went, an eighth of the limit at a time, the newest stay
+        assert len(utils.LINE_TABLE) >= 64 - 8
+        assert all((own, 1 << SIZE) in utils.LINE_TABLE for own in range(200 - 56, 200))
+        assert (1, 1 << SIZE) not in utils.LINE_TABLE
+    finally:
+        utils.LINE_TABLE.limit = limit
+
+
+@pytest.mark.skipif(utils.numpy is None, reason="needs numpy")
+def test_array_pattern_matches_pattern():
+    for seed in range(10):
+        board = random_board(seed, 60)
+        assert utils.ArrayPattern(board).get_total_pattern(1) == utils.Pattern(board).get_total_pattern(1)
+
+
+def test_batch_scores_match_total_score():
+    for seed in range(10):
+        # denser and denser, up to fives and live threes
+        board = random_board(seed, 20 + 8 * seed)
+        score = utils.Score(board)
+        evaluator = evaluator_of(board)
+        for role in (1, 2):
+            points = sorted(evaluator.frontier.cells)
+            deltas = [evaluator.frontier.delta(point, role) for point in points]
+            scores = score.batch_scores(evaluator.pattern, role, deltas)
+            for point, batch_score in zip(points, scores):
+                evaluator.apply(point, role)
+                assert batch_score == pytest.approx(score.total_score(evaluator.pattern, role))
+                evaluator.undo()
+
+
+def test_kill_finds_a_vcf():
+    with open(os.path.join(os.path.dirname(__file__), "bench_positions.json")) as f:
+        positions = {position["name"]: position for position in json.load(f)["positions"]}
+    position = positions["vcf-1"]
+    board = board_of_rows(position["board"])
+    role = position["to_move"]
+    last_point = tuple(reversed(position["last"]))
+    assert utils.Kill(board, 10).kill(role, last_point)
+    assert not utils.Kill(board, 10).kill(3 - role, last_point)
+
+
+def test_kill_without_threats():
+    board = board_of_rows(["." * 9] * 3 + ["...x.o..."] + ["...ox...."] + ["." * 9] * 4)
+    for role in (1, 2):
+        assert not utils.Kill(board, 10).kill(role, (4, 4))
@@ -1,4 +1,520 @@
-import copy
+import collections
+import itertools
+import json
+import math
+import operator
+import random
+import time
+
+try:
+    import numpy
+except ImportError:
+    # only ArrayPattern needs it
+    numpy = None
+
+
+class Zobrist:
+    '''
+    random 64-bit keys for every (role, position), the hash of a board is the xor of the keys of its stones
+    '''
+
+    def __init__(self, size, seed=20201):
+        '''
+        generate the keys, the seed is fixed so that a position always gets the same hash
+        :param size: the board size
+        :param seed: seed of the random generator
+        '''
+        rand = random.Random(seed)
+        self.size = size
+        self.keys = {role: [[rand.getrandbits(64) for _ in range(size)] for _ in range(size)] for role in (1, 2)}
+        self.side = {role: rand.getrandbits(64) for role in (1, 2)}
+        self.kill_keys = [rand.getrandbits(64) for _ in range(4)]
+
+    def hash(self, board):
+        '''
+        compute the hash of a whole board from scratch
+        :param board: 20*20 list
+        :return: 64-bit key
+        '''
+        key = 0
+        for x in range(self.size):
+            for y in range(self.size):
+                if board[x][y] in (1, 2):
+                    key ^= self.keys[board[x][y]][x][y]
+        return key
+
+
+class BitBoard(list):
+    '''
+    the board as a list of rows, read as board[x][y] like the 20*20 list it wraps,
+    which also keeps one bitset (python int) per role and direction
+    a line of every direction is stored as a run of bits followed by PAD empty bits, so a window of a line
+    is a shift and a mask
+    stones must be put and taken with place / remove to keep the bitsets and the zobrist key in step
+    '''
+
+    # rows (x fixed), columns (y fixed), diagonals and anti-diagonals
+    DIRECTIONS = ((0, 1), (1, 0), (1, 1), (-1, 1))
+    # empty bits between two lines, so a window of up to PAD squares beyond the edge never reads another line
+    PAD = 16
+
+    def __init__(self, board, zobrist=None):
+        '''
+        :param board: 20*20 list, its rows are shared with this object
+        :param zobrist: Zobrist keys used for self.hash
+        '''
+        list.__init__(self, board)
+        self.size = len(board)
+        self.zobrist = zobrist if zobrist is not None else Zobrist(self.size)
+        self.width = self.size + self.PAD
+        lines = 2 * self.size - 1
+        total = self.PAD * 2 + lines * self.width
+
+        # bit index of every position in every direction
+        self.bits = []
+        for dx, dy in self.DIRECTIONS:
+            self.bits.append([[self.PAD + self.line_index((x, y), (dx, dy)) * self.width + self.offset((x, y), (dx, dy))
+                               for y in range(self.size)] for x in range(self.size)])
+        self.valid = [0, 0, 0, 0]
+        for k in range(4):
+            for x in range(self.size):
+                for y in range(self.size):
+                    self.valid[k] |= 1 << self.bits[k][x][y]
+        self.invalid = [((1 << total) - 1) ^ valid for valid in self.valid]
+        # position of every bit index in every direction, None for the padding
+        self.points = [[None] * total for _ in range(4)]
+        for k in range(4):
+            for x in range(self.size):
+                for y in range(self.size):
+                    self.points[k][self.bits[k][x][y]] = (x, y)
+        self.row_mask = (1 << self.size) - 1
+        self.clear_bits()
+
+    def line_index(self, point, direct):
+        x, y = point
+        if direct == (0, 1):
+            return x
+        if direct == (1, 0):
+            return y
+        if direct == (1, 1):
+            return x - y + self.size - 1
+        return x + y
+
+    def offset(self, point, direct):
+        '''
+        position of the point on its line, growing when stepping along direct
+        '''
+        x, y = point
+        return x if direct in ((1, 0), (1, 1)) else y
+
+    def clear_bits(self):
+        '''
+        rebuild the bitsets and the hash from the list of rows
+        '''
+        # role 3 marks blocked squares (brain_block)
+        self.stones = {role: [0, 0, 0, 0] for role in (1, 2, 3)}
+        for x in range(self.size):
+            for y in range(self.size):
+                if self[x][y] != 0:
+                    self.set_bits(x, y, self[x][y])
+        self.hash = self.zobrist.hash(self)
+
+    def set_bits(self, x, y, role):
+        stones = self.stones[role]
+        for k in range(4):
+            stones[k] ^= 1 << self.bits[k][x][y]
+
+    def place(self, x, y, role):
+        '''
+        put a stone on an empty square, O(1)
+        :param role: 1, 2 or 3 (blocked)
+        '''
+        self[x][y] = role
+        self.set_bits(x, y, role)
+        if role != 3:
+            self.hash ^= self.zobrist.keys[role][x][y]
+
+    def remove(self, x, y):
+        '''
+        take the stone back from a square, O(1)
+        '''
+        role = self[x][y]
+        if role == 0:
+            return
+        self.set_bits(x, y, role)
+        if role != 3:
+            self.hash ^= self.zobrist.keys[role][x][y]
+        self[x][y] = 0
+
+    def occupied(self, k=0):
+        return self.stones[1][k] | self.stones[2][k] | self.stones[3][k]
+
+    def is_empty(self):
+        return self.occupied() == 0
+
+    def match(self, k, role, windows):
+        '''
+        find the empty squares e such that, for one of the windows (own, empty), e+o holds a stone of role
+        for every offset o in own and e+o is empty for every offset o in empty, along self.DIRECTIONS[k]
+        :param windows: list of (own offsets, empty offsets), offsets are at most PAD
+        :return: bitset of the squares in the layout of direction k, see cells
+        '''
+        free = self.valid[k] & ~self.occupied(k)
+        stones = self.stones[role][k]
+        # bit e of own_shifted[o] is set when square e+o holds a stone, of free_shifted[o] when it is empty
+        own_shifted = dict()
+        free_shifted = dict()
+        found = 0
+        for own, empty in windows:
+            window = free
+            for o in own:
+                if o not in own_shifted:
+                    own_shifted[o] = stones >> o if o > 0 else stones << -o
+                window &= own_shifted[o]
+            for o in empty:
+                if o not in free_shifted:
+                    free_shifted[o] = free >> o if o > 0 else free << -o
+                window &= free_shifted[o]
+            found |= window
+        return found
+
+    def cells(self, k, found):
+        '''
+        :param found: bitset in the layout of direction k
+        :return: the points (x,y) of its bits
+        '''
+        points = []
+        while found:
+            low = found & -found
+            points.append(self.points[k][low.bit_length() - 1])
+            found ^= low
+        return points
+
+    def segment(self, point, k, role, low, high):
+        '''
+        window of the line through point in direction self.DIRECTIONS[k], from offset low to high (included)
+        relative to the point, squares outside the board count as blocked
+        :return: (bits of role, bits of opponent or blocked squares), bit 0 is the square at offset low
+        '''
+        x, y = point
+        shift = self.bits[k][x][y] + low
+        mask = (1 << (high - low + 1)) - 1
+        own = (self.stones[role][k] >> shift) & mask
+        other = ((self.stones[3 - role][k] | self.stones[3][k] | self.invalid[k]) >> shift) & mask
+        return own, other
+
+
+class Timer:
+    '''
+    time budget of one move, built from the info timeout_turn and time_left sent by the manager
+    all times are in milliseconds
+    '''
+
+    def __init__(self, timeout_turn, time_left, stop=None, moves_left=25, margin=0.15):
+        '''
+        :param timeout_turn: time limit for one move, 0 means play as fast as possible
+        :param time_left: time left for the whole game
+        :param stop: function returning True when the search has to be stopped (pp.terminateAI)
+        :param moves_left: number of moves the remaining game time is shared by
+        :param margin: share of the budget kept back for the overhead of answering the manager
+        '''
+        self.start = time.monotonic()
+        self.stop = stop
+        budget = min(timeout_turn, time_left / moves_left)
+        self.budget = max(budget * (1 - margin) - 30, 0)
+
+    def elapsed(self):
+        return (time.monotonic() - self.start) * 1000
+
+    def is_up(self):
+        '''
+        :return: True if the search must return at once
+        '''
+        if self.stop is not None and self.stop():
+            return True
+        return self.elapsed() >= self.budget
+
+    def can_deepen(self):
+        '''
+        a new iteration costs several times the previous ones, so only start it early in the budget
+        :return: True if another iteration of the iterative deepening is worth starting
+        '''
+        return not self.is_up() and self.elapsed() < self.budget * 0.3
+
+
+# one slot of the transposition table as read back by probe,
+# flag: "EXACT" value, "LOWER" bound (search failed high) or "UPPER" bound (search failed low)
+TTEntry = collections.namedtuple("TTEntry", "key value depth flag move age")
+
+
+class TranspositionTable:
+    '''
+    fixed-size hash table of searched positions, indexed by the zobrist key
+    every slot is two 64-bit words of a flat buffer: the key xor the data, then the data packing the value,
+    depth, flag, age and move, so processes sharing the buffer need no lock: a slot torn by two writers
+    no longer matches its key and reads as empty
+    '''
+
+    FLAGS = ("", "EXACT", "LOWER", "UPPER")
+    # values are stored as 32-bit integers of value * VALUE_SCALE, so they are exact for the weights Score.load takes
+    # and hold the values of the search, all within Score.WIN plus the plies
+    VALUE_SCALE = 5
+    # bytes of a slot
+    SLOT = 16
+
+    def __init__(self, size=1 << 16, buffer=None):
+        '''
+        :param size: number of slots, the table never grows beyond it
+        :param buffer: writable buffer of size * SLOT bytes, shared memory for example, a new one if None
+        '''
+        self.size = size
+        # a table in a buffer of the caller, shared memory for example, keeps its size
+        self.shared = buffer is not None
+        self.buffer = memoryview(bytearray(size * self.SLOT) if buffer is None else buffer)[:size * self.SLOT]
+        self.words = self.buffer.cast("Q")
+        self.age = 0
+
+    def new_search(self):
+        '''
+        entries of older searches become the first to be replaced
+        '''
+        self.age = (self.age + 1) & 63
+
+    def clear(self):
+        self.buffer[:] = bytes(len(self.buffer))
+        self.age = 0
+
+    def resize(self, size):
+        '''
+        move the entries to a table of size slots, of two entries falling on the same slot the deeper is kept
+        '''
+        if size == self.size:
+            return
+        old = self.words
+        self.size = size
+        self.buffer = memoryview(bytearray(size * self.SLOT))
+        self.words = self.buffer.cast("Q")
+        for index in range(0, len(old), 2):
+            data = old[index + 1]
+            if data == 0:
+                continue
+            key = old[index] ^ data
+            new = key % size * 2
+            if self.words[new + 1] == 0 or self.words[new + 1] >> 32 & 0xFF <= data >> 32 & 0xFF:
+                self.words[new + 1] = data
+                self.words[new] = key ^ data
+
+    def release(self):
+        '''
+        let go of the buffer, the table is unusable afterwards
+        '''
+        self.words.release()
+        self.buffer.release()
+
+    def probe(self, key):
+        '''
+        :param key: zobrist key of the position
+        :return: the stored TTEntry or None
+        '''
+        index = key % self.size * 2
+        data = self.words[index + 1]
+        if data == 0 or self.words[index] ^ data != key:
+            return None
+        return self.unpack(key, data)
+
+    def store(self, key, value, depth, flag, move=None):
+        '''
+        depth-preferred replacement: a slot is overwritten by the same position, by a deeper search,
+        or when its entry is left over from an older search
+        '''
+        index = key % self.size * 2
+        data = self.words[index + 1]
+        if data != 0:
+            entry = self.unpack(self.words[index] ^ data, data)
+            if entry.key != key and depth < entry.depth and entry.age == self.age:
+                return
+            if move is None and entry.key == key:
+                move = entry.move
+        data = self.pack(value, depth, flag, move)
+        # the data first: a reader between the two writes sees a key that does not match
+        self.words[index + 1] = data
+        self.words[index] = key ^ data
+
+    def pack(self, value, depth, flag, move):
+        '''
+        :return: 64 bits: value (32), depth (8), flag (2) and age (6), move (16, 0 for None)
+        '''
+        value = round(value * self.VALUE_SCALE) & 0xFFFFFFFF
+        packed_move = 0 if move is None else (move[0] << 7 | move[1]) + 1
+        return value | min(depth, 255) << 32 | (self.FLAGS.index(flag) | self.age << 2) << 40 | packed_move << 48
+
+    def unpack(self, key, data):
+        value = data & 0xFFFFFFFF
+        if value >= 1 << 31:
+            value -= 1 << 32
+        flags = data >> 40 & 0xFF
+        packed_move = data >> 48
+        move = None if packed_move == 0 else ((packed_move - 1) >> 7, (packed_move - 1) & 127)
+        return TTEntry(key, value / self.VALUE_SCALE, data >> 32 & 0xFF, self.FLAGS[flags & 3], move, flags >> 2)
+
+
+class MemoryGovernor:
+    '''
+    keeps an engine within info max_memory: its transposition tables and LINE_TABLE are sized from it,
+    the caches emptied and the tables halved while the estimate of the live bytes is over it,
+    instead of letting the process grow
+    the other tables (history, killers, Frontier) are bounded by the board size and the depth
+    '''
+
+    # the interpreter with the modules and their tables, numpy included
+    BASE = 40 << 20
+    # one square cached in Frontier.deltas, the pattern changes of both roles
+    DELTA = 512
+    # share of the memory left to the tables that goes to the one of negamax, the one of Kill gets the rest
+    SEARCH_SHARE = 0.75
+    # share of the memory left taken by LINE_TABLE first, and the fewest lines it keeps
+    LINES_SHARE = 0.1
+    MIN_LINES = 1 << 12
+    # slots of a table without a limit, and the bounds with one
+    DEFAULT_SLOTS = 1 << 16
+    MIN_SLOTS = 1 << 10
+    MAX_SLOTS = 1 << 20
+
+    def __init__(self, max_memory=0):
+        '''
+        :param max_memory: bytes the process may use, 0 for no limit
+        '''
+        self.max_memory = max_memory
+
+    def slots(self, share):
+        '''
+        :param share: share of the memory left to the tables
+        :return: slots of a transposition table given that share
+        '''
+        if not self.max_memory:
+            return self.DEFAULT_SLOTS
+        slots = int((self.max_memory - self.BASE) * (1 - self.LINES_SHARE) * share) // TranspositionTable.SLOT
+        return max(min(slots, self.MAX_SLOTS), self.MIN_SLOTS)
+
+    def lines(self):
+        '''
+        :return: the most lines LINE_TABLE keeps
+        '''
+        if not self.max_memory:
+            return LineTable.DEFAULT_LIMIT
+        lines = int((self.max_memory - self.BASE) * self.LINES_SHARE) // LineTable.LINE
+        return max(min(lines, LineTable.DEFAULT_LIMIT), self.MIN_LINES)
+
+    def size(self, engine):
+        '''
+        size the tables of engine, a minMax.MinMax, and LINE_TABLE; a table shared with other processes is left as it is
+        '''
+        LINE_TABLE.limit = self.lines()
+        if len(LINE_TABLE) > LINE_TABLE.limit:
+            LINE_TABLE.evict()
+        for table, share in ((engine.transposition_table, self.SEARCH_SHARE),
+                             (engine.Kill.transposition_table, 1 - self.SEARCH_SHARE)):
+            if not table.shared:
+                table.resize(self.slots(share))
+
+    def live_bytes(self, engine):
+        '''
+        :return: estimate of the bytes used by the process
+        '''
+        tables = (engine.transposition_table, engine.Kill.transposition_table)
+        return (self.BASE + sum(len(table.buffer) for table in tables) + len(engine.frontier.deltas) * self.DELTA
+                + len(LINE_TABLE) * LineTable.LINE)
+
+    def govern(self, engine):
+        '''
+        before a search: while over the limit, drop the caches of Frontier and LINE_TABLE then halve the tables of engine
+        '''
+        if not self.max_memory:
+            return
+        if self.live_bytes(engine) > self.max_memory:
+            engine.frontier.deltas.clear()
+            LINE_TABLE.clear()
+        tables = [table for table in (engine.transposition_table, engine.Kill.transposition_table) if not table.shared]
+        while self.live_bytes(engine) > self.max_memory:
+            table = max(tables, key=lambda item: item.size, default=None)
+            if table is None or table.size <= self.MIN_SLOTS:
+                break
+            table.resize(table.size // 2)
+
+
+class MoveOrder:
+    '''
+    order of the moves tried by the search, learnt from the earlier searches of the game:
+    the principal variation, killer moves (moves that caused a cutoff at the same ply) and a history score
+    of every role and square
+    '''
+
+    def __init__(self, size, killers=2):
+        '''
+        :param size: the board size
+        :param killers: killer moves kept per ply
+        '''
+        self.size = size
+        self.killer_slots = killers
+        self.clear()
+
+    def clear(self):
+        '''
+        forget everything, for a new game
+        '''
+        self.pv = []
+        self.killers = []
+        self.history = [[[0] * self.size for _ in range(self.size)] for _ in range(3)]
+
+    def new_search(self):
+        '''
+        the history of older searches counts half as much as the coming one
+        '''
+        for rows in self.history:
+            for row in rows:
+                for y in range(self.size):
+                    row[y] >>= 1
+
+    def pv_move(self, ply):
+        return self.pv[ply] if ply < len(self.pv) else None
+
+    def order(self, candidates, role, ply, tt_move=None, pv_move=None):
+        '''
+        :param candidates: list of (point, score) in the order of Board.candidates
+        :param tt_move: best move of the transposition table for the position
+        :param pv_move: move of the principal variation when the search follows it
+        :return: the candidates sorted: principal variation, best move stored, killers, then by history
+        '''
+        killers = self.killers[ply] if ply < len(self.killers) else []
+        history = self.history[role]
+
+        def rank(item):
+            index, (point, _) = item
+            if point == pv_move:
+                first = 0
+            elif point == tt_move:
+                first = 1
+            elif point in killers:
+                first = 2 + killers.index(point)
+            else:
+                first = 2 + self.killer_slots
+            return first, -history[point[0]][point[1]], index
+
+        return [candidate for _, candidate in sorted(enumerate(candidates), key=rank)]
+
+    def cutoff(self, point, role, ply, depth):
+        '''
+        point caused a beta cutoff
+        :param depth: depth left below the node, deep cutoffs weigh more
+        '''
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if point in killers:
+            killers.remove(point)
+        killers.insert(0, point)
+        del killers[self.killer_slots:]
+        self.history[role][point[0]][point[1]] += depth * depth
 
 
 class Board:
@@ -6,112 +522,144 @@ class Board:
     implement movements on the board
     '''
 
-    def __init__(self, board):
+    def __init__(self, board, frontier, score=None):
         '''
         initialize Board class
         :param board: a list of 20*20
+        :param frontier: Frontier of the board, the squares worth playing
+        :param score: Score ranking the squares, a new one with the default weights if None
         '''
         self.board = board
         self.size = len(board)
+        self.frontier = frontier
+        self.Score = Score(board) if score is None else score
 
     def candidates(self, old_pattern, role, last_point):
         '''
-        search the most potential positions
+        search the most potential positions, all the squares of the frontier are scored in one pass
         :param old_pattern:  current board pattern
         :param role: AI or Opponent
-        :param last_point: the last move of opponent (x,y)
-        :return: list contain point and respond new pattern, for example：［(1,1) {[3,2]: 1}］
-        '''
-        pos = []
-
-        limit = (self.get_limit() + 2) * 2
-
-        directions = self.sort_directions(last_point)
-        iteration = 1
-        while iteration < limit:
-            pos = self.sort_steps(directions, iteration, last_point, old_pattern, role, pos)
-            iteration += 1
-        pos_list = sorted(pos, key=lambda item: item[1][0], reverse=True)
-        pattern_list = [(p[0], p[1][1]) for p in pos_list]
-        return pattern_list
-
-    def get_limit(self):
-        rows = [sum(self.board[i]) == 0 for i in range(self.size)]
-        cols = [sum(self.board[:][j]) == 0 for j in range(self.size)]
-        mid_rows = rows[rows.index(False) + 1:]
-        mid_rows.reverse()
-
-        if False in mid_rows:
-            limit_rows = mid_rows.index(False)
-        else:
-            limit_rows = 0
+        :param last_point: the last move of opponent (x,y), equal scores keep the squares nearer to it first
+        :return: list of (point, score), best first, the pattern changes of a point are only looked up
+        (see Frontier.delta) when it is played
+        '''
+        x0, y0 = last_point
+        cells = sorted(self.frontier.cells, key=lambda p: (abs(p[0] - x0) + abs(p[1] - y0), p))
+        scores = self.Score.batch_scores(old_pattern, role, [self.frontier.delta(point, role) for point in cells])
+        ranked = sorted(range(len(cells)), key=scores.__getitem__, reverse=True)
+        return [(cells[i], scores[i]) for i in ranked]
 
-        mid_cols = cols[cols.index(False) + 1:]
-        mid_cols.reverse()
-        if False in mid_cols:
-            limit_cols = mid_cols.index(False)
-        else:
-            limit_cols = 0
-        return max(limit_cols, limit_rows)
 
-    def sort_directions(self, point):
+class Frontier:
+    '''
+    the empty squares within distance of a stone, which are the only moves searched, kept up to date
+    move by move together with the pattern changes (Pattern.delta) of playing each of them
+    '''
+
+    def __init__(self, board, distance=2):
         '''
-        search directions with more room near opponent's last move
-        :param point: last move (x,y)
-        :return: sorted directions dic
+        :param board: BitBoard, place and remove have to be told every stone put on it or taken from it
+        :param distance: squares at most this many rows and columns away from a stone are candidates
         '''
-        directions = dict()
-        x, y = point
-        if x > self.size - x - 1:
-            directions["dx"] = (-1, 1)
-        else:
-            directions["dx"] = (1, -1)
-        if y > self.size - y - 1:
-            directions["dy"] = (-1, 1)
-        else:
-            directions["dy"] = (1, -1)
-        return directions
+        self.board = board
+        self.size = len(board)
+        self.distance = distance
+        self.Pattern = Pattern(board)
+        self.rebuild()
 
-    def sort_steps(self, directions, iteration, point, old_pattern, role, pos):
+    def rebuild(self):
         '''
-        for given iteration, search the empty points and score it
-        :param directions: the sorted directions define in self.sort_directions
-        :param iteration: the total number of steps
-        :param point: (x,y) the last movement of opponent
-        :param old_pattern: the current board pattern
-        :param role: AI or opponent
-        :param pos: list to save points which have been searched
-        :return:
+        start again from the stones of the board
+        '''
+        # near[x][y]: number of stones within distance of the square
+        self.near = [[0] * self.size for _ in range(self.size)]
+        for x in range(self.size):
+            for y in range(self.size):
+                if self.board[x][y] != 0:
+                    for i, j in self.window(x, y):
+                        self.near[i][j] += 1
+        self.cells = {(x, y) for x in range(self.size) for y in range(self.size)
+                      if self.board[x][y] == 0 and self.near[x][y] > 0}
+        # deltas[point][role]: Pattern.delta(point, role), dropped when a stone changes a line through point
+        self.deltas = dict()
+        # the deltas dropped by every place, given back by the matching remove
+        self.dropped = []
+
+    def window(self, x, y):
+        d = self.distance
+        return [(i, j) for i in range(max(x - d, 0), min(x + d + 1, self.size))
+                for j in range(max(y - d, 0), min(y + d + 1, self.size))]
+
+    def place(self, x, y):
+        '''
+        a stone was put on (x,y)
+        '''
+        for i, j in self.window(x, y):
+            self.near[i][j] += 1
+            if self.board[i][j] == 0:
+                self.cells.add((i, j))
+        self.cells.discard((x, y))
+        self.dropped.append(self.invalidate(x, y))
+
+    def remove(self, x, y):
+        '''
+        the stone of (x,y) was taken back, undoes the matching place
         '''
-        x0, y0 = point
-
-        for x1, y1 in [(x0 + iteration * directions["dx"][0], y0), (x0 + iteration * directions["dx"][1], y0),
-                       (x0, y0 + iteration * directions["dy"][0]), (x0, y0 + iteration * directions["dy"][1])]:
-            if 0 <= x1 < self.size and 0 <= y1 < self.size and self.board[x1][y1] == 0:
-                # choice the position important to both AI and Opponent
-                update_AI_pattern = Pattern(self.board).update(old_pattern, (x1, y1), role)
-                update_OP_pattern = Pattern(self.board).update(old_pattern, (x1, y1), 3 - role)
-                # score = Score(self.board).total_score(update_AI_pattern, role) + Score(self.board).total_score(
-                    # update_OP_pattern, 3 - role)
-                score = Score(self.board).total_score(update_AI_pattern, role)
-                pos.append([(x1, y1), [score, update_AI_pattern]])
-
-        step_x = 1
-        while step_x < iteration:
-            for dx in directions["dx"]:
-                for dy in directions["dy"]:
-                    x2 = step_x * dx + x0
-                    y2 = (iteration - step_x) * dy + y0
-                    if 0 <= x2 < self.size and 0 <= y2 < self.size and self.board[x2][y2] == 0:
-                        # choice the position important to both AI and Opponent
-                        update_AI_pattern = Pattern(self.board).update(old_pattern, (x2, y2), role)
-                        update_OP_pattern = Pattern(self.board).update(old_pattern, (x2, y2), 3 - role)
-                        # score = Score(self.board).total_score(update_AI_pattern, role) + Score(self.board).total_score(
-                            # update_OP_pattern, 3 - role)
-                        score = Score(self.board).total_score(update_AI_pattern, role)
-                        pos.append([(x2, y2), [score, update_AI_pattern]])
-            step_x += 1
-        return pos
+        for i, j in self.window(x, y):
+            self.near[i][j] -= 1
+            if self.near[i][j] == 0:
+                self.cells.discard((i, j))
+        if self.near[x][y] > 0:
+            self.cells.add((x, y))
+        self.invalidate(x, y)
+        self.deltas.update(self.dropped.pop())
+
+    def invalidate(self, x, y):
+        '''
+        drop the deltas of the squares whose lines see (x,y)
+        :return: dict of the deltas dropped
+        '''
+        dropped = dict()
+        for dx, dy in BitBoard.DIRECTIONS:
+            for step in range(-RAY, RAY + 1):
+                point = (x + step * dx, y + step * dy)
+                deltas = self.deltas.pop(point, None)
+                if deltas is not None:
+                    dropped[point] = deltas
+        return dropped
+
+    def delta(self, point, role):
+        '''
+        :return: Pattern.delta(point, role), from the cache when the lines of point did not change
+        '''
+        deltas = self.deltas.get(point)
+        if deltas is None:
+            deltas = self.deltas[point] = dict()
+        delta = deltas.get(role)
+        if delta is None:
+            delta = deltas[role] = self.Pattern.delta(point, role)
+        return delta
+
+
+# pattern keys: (length of the stones, number of empty ends) and (length, ends, "S") for a line with one gap,
+# a pattern is a list of counts per role in the order of PATTERN_KEYS, all the lines of five or more
+# count at FIVE_INDEX
+PATTERN_KEYS = ((1, 1), (1, 2), (2, 1), (2, 2), (3, 1), (3, 2), (4, 1), (4, 2),
+                (3, 1, "S"), (3, 2, "S"), (4, 0, "S"), (4, 1, "S"), (4, 2, "S"))
+PATTERN_INDEX = {key: index for index, key in enumerate(PATTERN_KEYS)}
+FIVE_INDEX = len(PATTERN_KEYS)
+PATTERN_LENGTH = FIVE_INDEX + 1
+
+
+def pattern_index(key):
+    '''
+    :return: the index of a pattern key in the counts of a pattern
+    '''
+    return FIVE_INDEX if key[0] >= 5 else PATTERN_INDEX[key]
+
+
+def new_pattern():
+    return [0] * PATTERN_LENGTH
 
 
 class Score:
@@ -122,16 +670,121 @@ class Score:
     rule: 0 empty ; 1 occupied by AI ; 2 occupied by opponent
     '''
 
+    # default weights, see load for changing them
+    SCORES = {
+        (1, 1): 1,
+        (1, 2): 10,
+        (2, 1): 10,
+        (2, 2): 100,
+        (3, 1, "S"): 100,
+        (3, 2, "S"): 1000,
+        (3, 1): 1000,
+        (3, 2): 10000,
+        (4, 0, "S"): 10000,
+        (4, 1, "S"): 15000,
+        (4, 2, "S"): 100000,
+        (4, 1): 200000,
+        (4, 2): 1000000}
+    # score of any line of five or more, whatever its ends and count
+    FIVE = 1000000
+    # two of these together earn LIVE3_BONUS
+    LIVE3 = ((3, 2), (3, 1, "S"))
+    LIVE3_BONUS = 300
+    # the patterns of the opponent weigh this much more than the own ones in total_score
+    OPPONENT = 1.4
+    # weights file in the folder of persistent files (info folder), see load
+    WEIGHTS_FILE = "weights.json"
+    # value of a won position for the side to move, less one per ply to the five so that the search
+    # prefers the quickest win and the slowest loss, beyond any total_score
+    WIN = 10 ** 8
+    # values at least this far from 0 are wins or losses
+    WIN_BOUND = WIN - 1000
+    # total_score stays within this bound whatever the weights, below the wins
+    EVAL_BOUND = WIN_BOUND - 1
+
     def __init__(self, board):
         self.board = board
         self.size = len(self.board)
+        self.set_weights(self.SCORES, self.FIVE, self.LIVE3_BONUS, self.OPPONENT)
+
+    def set_weights(self, scores, five, live3_bonus, opponent):
+        '''
+        :param scores: dict of the weight of every key of PATTERN_KEYS
+        '''
+        # weight of every count of a pattern, the fives are scored apart
+        self.weights = [scores[key] for key in PATTERN_KEYS] + [0]
+        self.five = five
+        self.live3_bonus = live3_bonus
+        self.opponent = opponent
+        self.live3 = [PATTERN_INDEX[key] for key in self.LIVE3]
+
+    def load(self, path):
+        '''
+        read the weights from a json file, the ones it leaves out keep their default:
+        {"patterns": {"3,2": 10000, "3,1,S": 100, ..}, "five": .., "live3_bonus": .., "opponent": ..}
+        the weights are whole numbers and opponent a multiple of 1 / TranspositionTable.VALUE_SCALE,
+        so that the scores are stored exactly, and none is beyond EVAL_BOUND
+        :raise OSError, ValueError: the file cannot be read or has unknown names or weights that are not numbers
+        or break these limits
+        '''
+        with open(path) as f:
+            config = json.load(f)
+        if not isinstance(config, dict) or set(config) - {"patterns", "five", "live3_bonus", "opponent"}:
+            raise ValueError("{} is not a weights file".format(path))
+        patterns = config.get("patterns", dict())
+        if not isinstance(patterns, dict):
+            raise ValueError("patterns of {} must be an object".format(path))
+        scores = dict(self.SCORES)
+        for name, weight in patterns.items():
+            key = tuple(int(part) if part.isdigit() else part for part in name.split(","))
+            if key not in scores:
+                raise ValueError("unknown pattern {} in {}".format(name, path))
+            scores[key] = weight
+        weights = list(scores.values()) + [config.get(name, 0) for name in ("five", "live3_bonus", "opponent")]
+        # json true and false are numbers to isinstance
+        if not all(isinstance(weight, (int, float)) and not isinstance(weight, bool) and math.isfinite(weight)
+                   for weight in weights):
+            raise ValueError("weights of {} must be numbers".format(path))
+        five = config.get("five", self.FIVE)
+        live3_bonus = config.get("live3_bonus", self.LIVE3_BONUS)
+        opponent = config.get("opponent", self.OPPONENT)
+        whole = list(scores.values()) + [five, live3_bonus]
+        if not all(float(weight).is_integer() for weight in whole):
+            raise ValueError("the pattern weights, five and live3_bonus of {} must be whole numbers".format(path))
+        scaled = opponent * TranspositionTable.VALUE_SCALE
+        if abs(scaled - round(scaled)) > 1e-9:
+            raise ValueError("opponent of {} must be a multiple of 1/{}".format(path, TranspositionTable.VALUE_SCALE))
+        if any(abs(weight) > self.EVAL_BOUND for weight in whole) or abs(opponent) * max(map(abs, whole)) > self.EVAL_BOUND:
+            raise ValueError("weights of {} must stay within {}".format(path, self.EVAL_BOUND))
+        self.set_weights({key: int(weight) for key, weight in scores.items()}, int(five), int(live3_bonus),
+                         round(scaled) / TranspositionTable.VALUE_SCALE)
+
+    @staticmethod
+    def to_table(value, ply):
+        '''
+        a win counted from the root becomes counted from the node, to be stored in a transposition table
+        '''
+        if value >= Score.WIN_BOUND:
+            return value + ply
+        if value <= -Score.WIN_BOUND:
+            return value - ply
+        return value
+
+    @staticmethod
+    def from_table(value, ply):
+        '''
+        undo to_table for a node at ply
+        '''
+        if value >= Score.WIN_BOUND:
+            return value - ply
+        if value <= -Score.WIN_BOUND:
+            return value + ply
+        return value
 
     def checkWinner(self, check_pattern):
-        AI_lens = [key[0] for key in check_pattern[1].keys()]
-        if len(AI_lens) > 0 and max(AI_lens) >= 5:
+        if check_pattern[1][FIVE_INDEX] > 0:
             return 1
-        OP_lens = [key[0] for key in check_pattern[2].keys()]
-        if len(OP_lens) > 0 and max(OP_lens) >= 5:
+        if check_pattern[2][FIVE_INDEX] > 0:
             return 2
         return 0
 
@@ -144,58 +797,201 @@ class Score:
         '''
         AI_score = self.get_score(total_pattern[role])
         opponent_score = self.get_score(total_pattern[3 - role])
-        total_score = AI_score - 1.4 * opponent_score
-        return total_score
+        total_score = AI_score - self.opponent * opponent_score
+        return max(-self.EVAL_BOUND, min(total_score, self.EVAL_BOUND))
 
     def get_score(self, score_pattern):
         '''
-        keys of score dict are (length of chess in a line for specified direction, number of live nodes)
+        the counts of the pattern times their weights, the fives and the bonus of two live threes apart
         :return: score of pattern
         '''
-        score = 0
-        # score_dic = {
-        #     (1, 1): 1,
-        #     (1, 2): 10,
-        #     (2, 1): 10,
-        #     (2, 2): 100,
-        #     (3, 1, "S"): 100,
-        #     (3, 2, "S"): 1000,
-        #     (3, 1): 100,
-        #     (3, 2): 1000,
-        #     (4, 0, "S"): 1100,
-        #     (4, 1, "S"): 1100,
-        #     (4, 2, "S"): 100000,
-        #     (4, 1): 1100,
-        #     (4, 2): 100000}
-
-        score_dic = {
-            (1, 1): 1,
-            (1, 2): 10,
-            (2, 1): 10,
-            (2, 2): 100,
-            (3, 1, "S"): 100,
-            (3, 2, "S"): 1000,
-            (3, 1): 1000,
-            (3, 2): 10000,
-            (4, 0, "S"): 10000,
-            (4, 1, "S"): 15000,
-            (4, 2, "S"): 100000,
-            (4, 1): 200000,
-            (4, 2): 1000000}
-
-        live3_count = 0
-        for key in score_pattern.keys():
-            length = key[0]
-            if key == (3, 2) or key == (3, 1, "S"):
-                live3_count += score_pattern[key]
-            if length >= 5:
-                score += 1000000
-            else:
-                score += score_dic[key] * score_pattern[key]
-        if live3_count >= 2:
-            score += 300
+        score = sum(map(operator.mul, self.weights, score_pattern))
+        if score_pattern[FIVE_INDEX] > 0:
+            score += self.five
+        if sum(score_pattern[index] for index in self.live3) >= 2:
+            score += self.live3_bonus
         return score
 
+    def batch_scores(self, total_pattern, role, deltas):
+        '''
+        total_score of the pattern changed by each of the deltas, in one pass that leaves the pattern as it is:
+        the score of a pattern is linear in its counts but for the fives and the bonus of two live threes
+        :param total_pattern: dict save AI pattern and opponent pattern
+        :param role: the side the scores are for
+        :param deltas: list of pattern changes, see Pattern.delta
+        :return: list of the scores, in the order of deltas
+        '''
+        weights = self.weights
+        base = {side: self.get_score(total_pattern[side]) for side in (1, 2)}
+        live3 = {side: sum(total_pattern[side][index] for index in self.live3) for side in (1, 2)}
+        scores = []
+        for delta in deltas:
+            score = dict(base)
+            live3_change = {1: 0, 2: 0}
+            fives = None
+            for side, index, change in delta:
+                if index == FIVE_INDEX:
+                    if fives is None:
+                        fives = {1: 0, 2: 0}
+                    fives[side] += change
+                    continue
+                score[side] += weights[index] * change
+                if index in self.live3:
+                    live3_change[side] += change
+            for side in (1, 2):
+                if live3_change[side] != 0:
+                    score[side] += self.live3_bonus * ((live3[side] + live3_change[side] >= 2) - (live3[side] >= 2))
+            if fives is not None:
+                # a five scores once whatever its count
+                for side, change in fives.items():
+                    count = total_pattern[side][FIVE_INDEX]
+                    score[side] += self.five * ((count + change != 0) - (count != 0))
+            scores.append(max(-self.EVAL_BOUND, min(score[role] - self.opponent * score[3 - role], self.EVAL_BOUND)))
+        return scores
+
+
+def line_patterns(cells):
+    '''
+    count the patterns of a whole line
+    :param cells: squares of the line, 0 empty, 1 role, 2 opponent or blocked
+    :return: tuple of (index of the pattern key, count), see PATTERN_KEYS
+    '''
+    cells = [2] + list(cells) + [2]
+    counts = dict()
+    # runs of role stones: (length, number of empty ends), dead runs only count when they are five or more
+    runs = dict()
+    i = 1
+    while i < len(cells) - 1:
+        if cells[i] == 1:
+            start = i
+            while cells[i] == 1:
+                i += 1
+            runs[start] = i - start
+            runs[i - 1] = i - start
+            end = (cells[start - 1] == 0) + (cells[i] == 0)
+            if end > 0 or i - start >= 5:
+                counts[(i - start, end)] = counts.get((i - start, end), 0) + 1
+        else:
+            i += 1
+    # split patterns: runs of role stones on both sides of one empty square
+    for i in range(2, len(cells) - 2):
+        if cells[i] == 0 and cells[i - 1] == 1 and cells[i + 1] == 1:
+            head, tail = runs[i - 1], runs[i + 1]
+            end = (cells[i - head - 1] == 0) + (cells[i + tail + 1] == 0)
+            if head + tail == 3 and end > 0:
+                counts[(3, end, "S")] = counts.get((3, end, "S"), 0) + 1
+            elif head + tail == 4:
+                counts[(4, end, "S")] = counts.get((4, end, "S"), 0) + 1
+    return tuple((pattern_index(key), count) for key, count in counts.items())
+
+
+# stones further than this from a point never change the delta of playing it (see Frontier.invalidate),
+# as a run of five or more counts as five whatever its ends
+RAY = 10
+class LineTable(dict):
+    '''
+    patterns of the lines met so far, keyed by the bitsets of the line; when it holds limit lines,
+    the oldest ones go a few at a time, so the lines of the current search stay
+    '''
+
+    # bytes of one line, its key and its patterns
+    LINE = 320
+    # lines kept without a memory limit, about 20 MB
+    DEFAULT_LIMIT = 1 << 16
+    # share of the limit evicted at once
+    EVICT_SHARE = 1 / 8
+
+    def __init__(self, limit=DEFAULT_LIMIT):
+        dict.__init__(self)
+        self.limit = limit
+
+    def evict(self):
+        '''
+        take out the lines met first (dicts keep the order of insertion) to make room for new ones
+        '''
+        count = len(self) - self.limit + max(int(self.limit * self.EVICT_SHARE), 1)
+        for key in list(itertools.islice(self, count)):
+            del self[key]
+
+
+# the lines of line_table, sized by MemoryGovernor
+LINE_TABLE = LineTable()
+
+
+def line_table(own, other, size):
+    '''
+    :param own: bits of the squares of role along a whole line, bit i is square i
+    :param other: bits of the squares of the opponent, blocked or beyond the end of the line
+    :param size: the board size
+    :return: the patterns of the line as ((index of the pattern key, count), ...), memoised in LINE_TABLE
+    '''
+    patterns = LINE_TABLE.get((own, other))
+    if patterns is None:
+        if len(LINE_TABLE) >= LINE_TABLE.limit:
+            LINE_TABLE.evict()
+        patterns = line_patterns([1 if own >> i & 1 else 2 if other >> i & 1 else 0 for i in range(size)])
+        LINE_TABLE[(own, other)] = patterns
+    return patterns
+
+
+def add_delta(pattern, delta, sign=1):
+    '''
+    apply the changes of Pattern.delta to a pattern in place
+    :param sign: 1 to apply the changes, -1 to revert them
+    '''
+    for role, index, change in delta:
+        pattern[role][index] += sign * change
+
+
+class Evaluator:
+    '''
+    the board pattern kept up to date in place while moves are made and unmade,
+    every move pushes its pattern changes on a stack so undo can take them back
+    '''
+
+    def __init__(self, board, pattern, frontier):
+        '''
+        :param board: BitBoard the moves are played on
+        :param pattern: pattern of the board, see Pattern.get_total_pattern, updated in place
+        :param frontier: Frontier of the board, kept up to date as well
+        '''
+        self.board = board
+        self.pattern = pattern
+        self.frontier = frontier
+        self.moves = []
+
+    def reset(self, pattern):
+        '''
+        start again from a pattern computed from scratch, the pattern objects are kept
+        '''
+        for role in (1, 2):
+            self.pattern[role][:] = pattern[role]
+        self.frontier.rebuild()
+        self.moves = []
+
+    def apply(self, point, role, delta=None):
+        '''
+        play role on point
+        :param delta: the changes of Pattern.delta for this move if already known
+        '''
+        if delta is None:
+            delta = self.frontier.delta(point, role)
+        add_delta(self.pattern, delta)
+        self.board.place(point[0], point[1], role)
+        self.frontier.place(point[0], point[1])
+        self.moves.append((point, delta))
+
+    def undo(self):
+        '''
+        take back the last move of apply
+        :return: the point of the move
+        '''
+        point, delta = self.moves.pop()
+        self.board.remove(point[0], point[1])
+        self.frontier.remove(point[0], point[1])
+        add_delta(self.pattern, delta, -1)
+        return point
+
 
 class Pattern:
     '''
@@ -203,10 +999,11 @@ class Pattern:
     '''
 
     def __init__(self, board):
+        '''
+        :param board: BitBoard, lines are read from its bitsets
+        '''
         self.board = board
         self.size = len(board)
-        self.status = {"N": {"length": 0, "end": 0}, "S": {"length": [0, 0], "end": 0}}
-        self.size = len(self.board)
 
     def get_total_pattern(self, role):
         '''
@@ -225,7 +1022,7 @@ class Pattern:
         :param role: AI or Opponent
         :return: pattern
         '''
-        role_pattern = dict()
+        role_pattern = new_pattern()
         direct = (0, 1)
         for x in range(self.size):
             y = 0
@@ -256,366 +1053,301 @@ class Pattern:
         '''
         search the whole board from different directions
         :param point: the start point, always located in the edge of board
-        :param direct: one of the 8 directions on board, for example: (1,1)
+        :param direct: one of the 4 directions of BitBoard.DIRECTIONS, for example: (1,1)
         :param role: AI or Opponent
         :param direct_pattern: the dict to save point which have been searched
         :return: the updated pattern dict
         '''
+        own, other = self.board.segment(point, BitBoard.DIRECTIONS.index(direct), role, 0, self.size - 1)
+        for index, count in line_table(own, other, self.size):
+            direct_pattern[index] += count
+        return direct_pattern
 
+    def line_start(self, point, k):
+        '''
+        :param k: index of the direction in BitBoard.DIRECTIONS
+        :return: (the square at the edge of the board where direct_search starts the line through point,
+        offset of point from it)
+        '''
         x, y = point
-        dx, dy = direct
-        state = copy.deepcopy(self.status)
-        start = 3 - role
-        while 0 <= x < self.size and 0 <= y < self.size:
-            if self.board[x][y] == role:
-                state["N"]["length"] += 1
-            if self.board[x][y] == 0:
-                if state["N"]["length"] > 0:
-                    self.get_next_length((x, y), direct, role, state)
-                    if start == 0:
-                        state["N"]["end"] += 1
-                        state["S"]["end"] += 1
-                    state["N"]["end"] += 1
-                    if (state["N"]["length"], state["N"]["0"]) in direct_pattern.keys():
-                        direct_pattern[(state["N"]["length"], state["N"]["end"])] += 1
-                    else:
-                        direct_pattern[(state["N"]["length"], state["N"]["end"])] = 1
-                    if state["S"]["length"] > 0 and state["S"]["length"] + state["N"]["length"] == 3:
-                        if start == 0 or state["S"]["end"] == 1:
-                            end = state["S"]["end"]
-                            if start == 0:
-                                end += 1
-                            if end > 0:
-                                if (3, end, "S") in direct_pattern.keys():
-                                    direct_pattern[(3, end, "S")] += 1
-                                else:
-                                    direct_pattern[(3, end, "S")] = 1
-                    if state["S"]["length"] > 0 and state["S"]["length"] + state["N"]["length"] == 4:
-                        if start == 0 or state["S"]["end"] == 1:
-                            end = state["S"]["end"]
-                            if start == 0:
-                                end += 1
-                            if (4, end, "S") in direct_pattern.keys():
-                                direct_pattern[(4, end, "S")] += 1
-                            else:
-                                direct_pattern[(4, end, "S")] = 1
-                state = copy.deepcopy(self.status)
-                start = 0
-            if self.board[x][y] == 3 - role:
-                if state["N"]["length"] > 0:
-                    if start == 0:
-                        state["N"]["end"] += 1
-                    if state["N"]["end"] > 0:
-                        if (state["N"]["length"], state["N"]["end"]) in direct_pattern.keys():
-                            direct_pattern[(state["length"], state["end"])] += 1
-                        else:
-                            direct_pattern[(state["length"], state["end"])] = 1
-                state = copy.deepcopy(self.status)
-                start = 3 - role
-            x += dx
-            y += dy
-        if state["N"]["length"] > 0:
-            if start == 0:
-                state["end"] += 1
-            if state["N"]["end"] > 0:
-                if (state["length"], state["end"]) in direct_pattern.keys():
-                    direct_pattern[(state["length"], state["end"])] += 1
-                else:
-                    direct_pattern[(state["length"], state["end"])] = 1
-        return direct_pattern
+        dx, dy = BitBoard.DIRECTIONS[k]
+        if dx == 0:
+            step = y
+        elif dy == 0:
+            step = x
+        elif dx == 1:
+            step = min(x, y)
+        else:
+            step = min(y, self.size - 1 - x)
+        return (x - step * dx, y - step * dy), step
 
-    def update(self, old_pattern, point, role):
+    def delta(self, point, role):
         '''
-        update the old pattern by search area near target point
-        :param old_pattern: pattern dict contain AI(1) and Opponent Pattern(2)
-        [{AI:{[length, number of live end]: count}}{Opponent:{[length, number of live end]:count}}]
-        for example [{1:{[3, 2]:1}}{2:{[2,1]:1,[1,2]:1}}]
-        :param point: the target point, for example(10,10)
+        changes of the pattern when role plays the target point: the patterns of the 4 lines through it
+        after the move less the ones before, looked up like in direct_search so that both always agree
+        :param point: the target point, for example(10,10), must be empty
         :param role: AI(1) or Opponent(2)
-        :return: updated pattern
-        '''
-        update_pattern = copy.deepcopy(old_pattern)
-        point_AI_pattern, point_OP_pattern = self.get_point(point, role)
-        for key in [(1, 0), (1, 1), (0, 1), (-1, 1)]:
-            dx, dy = key
-            len_AI, end_AI = point_AI_pattern[(dx, dy)]["N"]["length"], point_AI_pattern[(dx, dy)]["N"]["end"]
-            len_OP, end_OP = point_OP_pattern[(dx, dy)]["N"]["length"], point_OP_pattern[(dx, dy)]["N"]["end"]
-            len_AI_N, end_AI_N = point_AI_pattern[(-dx, -dy)]["N"]["length"], point_AI_pattern[(-dx, -dy)]["N"]["end"]
-            len_OP_N, end_OP_N = point_OP_pattern[(-dx, -dy)]["N"]["length"], point_OP_pattern[(-dx, -dy)]["N"]["end"]
-
-            len_S_AI, end_S_AI = point_AI_pattern[(dx, dy)]["S"]["length"], point_AI_pattern[(dx, dy)]["S"]["end"]
-            len_S_AI_N, end_S_AI_N = point_AI_pattern[(-dx, -dy)]["S"]["length"], point_AI_pattern[(-dx, -dy)]["S"][
-                "end"]
-            len_S_OP, end_S_OP = point_OP_pattern[(dx, dy)]["S"]["length"], point_OP_pattern[(dx, dy)]["S"]["end"]
-            len_S_OP_N, end_S_OP_N = point_OP_pattern[(-dx, -dy)]["S"]["length"], point_OP_pattern[(-dx, -dy)]["S"][
-                "end"]
-
-            # update split pattern
-            # update AI (Split 4)
-            cond1 = sum(len_S_AI) == 1 and len_AI_N == 1
-            cond2 = sum(len_S_AI) == 2 and len_AI_N == 0
-            cond3 = sum(len_S_AI_N) == 1 and len_AI == 1
-            cond4 = sum(len_S_AI_N) == 2 and len_AI == 0
-            if cond1 or cond2:
-                end = end_S_AI + end_AI_N
-                if end > 0:
-                    key = (3, end, "S")
-                    if key in update_pattern[role].keys():
-                        update_pattern[role][key] += 1
-                    else:
-                        update_pattern[role][key] = 1
-            if cond3 or cond4:
-                end = end_S_AI_N + end_AI
-                if end > 0:
-                    key = (3, end, "S")
-                    if key in update_pattern[role].keys():
-                        update_pattern[role][key] += 1
-                    else:
-                        update_pattern[role][key] = 1
-
-            if len_AI_N + len_AI == 3 and (len_AI != 0 and len_AI_N != 0):
-                end = end_AI + end_AI_N
-                if end > 0:
-                    update_pattern[role][(3, end, "S")] -= 1
-
-            # update AI(Split 5)
-            cond1 = sum(len_S_AI) == 1 and len_AI_N == 2
-            cond2 = sum(len_S_AI) == 2 and len_AI_N == 1
-            cond3 = sum(len_S_AI) == 3 and len_AI_N == 0
-            cond4 = sum(len_S_AI_N) == 1 and len_AI == 2
-            cond5 = sum(len_S_AI_N) == 2 and len_AI == 1
-            cond6 = sum(len_S_AI_N) == 3 and len_AI == 0
-            if cond1 or cond2 or cond3:
-                end = end_S_AI + end_AI_N
-                key = (4, end, "S")
-                if key in update_pattern[role].keys():
-                    update_pattern[role][key] += 1
-                else:
-                    update_pattern[role][key] = 1
-            if cond4 or cond5 or cond6:
-                end = end_S_AI_N + end_AI
-                key = (4, end, "S")
-                if key in update_pattern[role].keys():
-                    update_pattern[role][key] += 1
-                else:
-                    update_pattern[role][key] = 1
-
-            if len_AI_N + len_AI == 4 and (len_AI != 0 and len_AI_N != 0):
-                end = end_AI + end_AI_N
-                update_pattern[role][(4, end, "S")] -= 1
-
-            # update opponent (Split 4)
-            if len_OP + len_OP_N == 3 and len_OP != 0 and len_OP_N != 0:
-                end = end_OP + end_OP_N
-                if end > 0:
-                    update_pattern[3 - role][(3, end, "S")] -= 1
-
-            if sum(len_S_OP) == 3 and len_S_OP[0] > 0:
-                end = end_S_OP + 1
-                update_pattern[3 - role][(3, end, "S")] -= 1
-                if end_S_OP > 0:
-                    if (3, end_S_OP, "S") in update_pattern[3 - role].keys():
-                        update_pattern[3 - role][(3, end_S_OP, "S")] += 1
-                    else:
-                        update_pattern[3 - role][(3, end_S_OP, "S")] = 1
-
-            if sum(len_S_OP_N) == 3 and len_S_OP_N[0] > 0:
-                end = end_S_OP_N + 1
-                update_pattern[3 - role][(3, end, "S")] -= 1
-                if end_S_OP_N > 0:
-                    if (3, end_S_OP_N, "S") in update_pattern[3 - role].keys():
-                        update_pattern[3 - role][(3, end_S_OP_N, "S")] += 1
-                    else:
-                        update_pattern[3 - role][(3, end_S_OP_N, "S")] = 1
-
-            # update opponent (Split 5)
-            if len_OP + len_OP_N == 4 and len_OP != 0 and len_OP_N != 0:
-                end = end_OP + end_OP_N
-                update_pattern[3 - role][(4, end, "S")] -= 1
-
-            if sum(len_S_OP) == 4 and len_S_OP[0] > 0:
-                end = end_S_OP + 1
-                update_pattern[3 - role][(4, end, "S")] -= 1
-                if (4, end_S_OP, "S") in update_pattern[3 - role].keys():
-                    update_pattern[3 - role][(4, end_S_OP, "S")] += 1
+        :return: list of (role, index of the pattern key, change of the count), see add_delta
+        '''
+        delta = []
+        for k in range(4):
+            start, step = self.line_start(point, k)
+            bit = 1 << step
+            for side in (role, 3 - role):
+                own, other = self.board.segment(start, k, side, 0, self.size - 1)
+                # a line without a stone of side has no pattern of it, before or after an opponent move
+                if side != role and own == 0:
+                    continue
+                changes = dict()
+                if side == role:
+                    after = line_table(own | bit, other, self.size)
                 else:
-                    update_pattern[3 - role][(4, end_S_OP, "S")] = 1
+                    after = line_table(own, other | bit, self.size)
+                for index, count in after:
+                    changes[index] = count
+                for index, count in line_table(own, other, self.size):
+                    changes[index] = changes.get(index, 0) - count
+                delta += [(side, index, change) for index, change in changes.items() if change != 0]
+        return delta
 
-            if sum(len_S_OP_N) == 4 and len_S_OP_N[0] > 0:
-                end = end_S_OP_N + 1
-                update_pattern[3 - role][(4, end, "S")] -= 1
-                if (4, end_S_OP_N, "S") in update_pattern[3 - role].keys():
-                    update_pattern[3 - role][(4, end_S_OP_N, "S")] += 1
-                else:
-                    update_pattern[3 - role][(4, end_S_OP_N, "S")] = 1
-
-            # update normal pattern
-            if len_AI > 0:
-                update_pattern[role][len_AI, end_AI + 1] -= 1
-
-            elif len_OP > 0:
-                if end_OP > 0:
-                    if (len_OP, end_OP) in update_pattern[3 - role].keys():
-                        update_pattern[3 - role][len_OP, end_OP] += 1
-                    else:
-                        update_pattern[3 - role][len_OP, end_OP] = 1
-
-                update_pattern[3 - role][len_OP, end_OP + 1] -= 1
-
-            if len_AI_N > 0:
-                update_pattern[role][len_AI_N, end_AI_N + 1] -= 1
-
-            elif len_OP_N > 0:
-                if end_OP_N > 0:
-                    if (len_OP_N, end_OP_N) in update_pattern[3 - role].keys():
-                        update_pattern[3 - role][len_OP_N, end_OP_N] += 1
-                    else:
-                        update_pattern[3 - role][len_OP_N, end_OP_N] = 1
-                update_pattern[3 - role][len_OP_N, end_OP_N + 1] -= 1
-            next_length = len_AI + len_AI_N + 1
-            next_end = end_AI + end_AI_N
-            if next_end > 0 or next_length ==5:
-                if (next_length, next_end) in update_pattern[role].keys():
-                    update_pattern[role][next_length, next_end] += 1
-                else:
-                    update_pattern[role][next_length, next_end] = 1
 
-        return update_pattern
+class ArrayPattern(Pattern):
+    '''
+    Pattern whose whole board search reads every line at once from a numpy copy of the board,
+    through strided views of it, the patterns of every line are looked up like in direct_search
+    '''
 
-    def get_point(self, point, role):
+    def __init__(self, board):
         '''
-        get the AI and Opponent distribution info near the point
-        :param point: for example (10,10)
-        :param role: AI(1) or Opponent(2)
-        :return: AI point pattern and Opponent point pattern
+        :param board: BitBoard, needs numpy
         '''
-        point_AI_pattern = dict()
-        point_OP_pattern = dict()
-        for i in range(-1, 2, 1):
-            for j in range(-1, 2, 1):
-                if i != 0 or j != 0:
-                    point_AI_pattern[(i, j)] = self.get_length(point, role, (i, j))
-                    point_OP_pattern[(i, j)] = self.get_length(point, 3 - role, (i, j))
-        return point_AI_pattern, point_OP_pattern
+        Pattern.__init__(self, board)
+        n = self.size
+        # the board in the middle of blocked squares (3), read by the lines running off the board
+        self.padded = numpy.full((3 * n, 3 * n), 3, dtype=numpy.int8)
+        self.inner = self.padded[n:2 * n, n:2 * n]
+        rows, columns = self.inner.strides
+        view = numpy.lib.stride_tricks.as_strided
+        # lines in the order and direction of get_pattern, square i of a line is its bit i in direct_search
+        self.views = [
+            self.inner,
+            self.inner.T,
+            view(self.inner, (n, n), (rows, rows + columns)),
+            view(self.inner[:, 1:], (n - 1, n), (columns, rows + columns)),
+            view(self.inner, (n, n), (rows, columns - rows)),
+            view(self.inner[n - 1:, 1:], (n - 1, n), (columns, columns - rows)),
+        ]
+
+    def get_total_pattern(self, role):
+        self.inner[:] = numpy.array(self.board, dtype=numpy.int8)
+        lines = numpy.concatenate(self.views)
+        return {role: self.lines_pattern(lines, role), 3 - role: self.lines_pattern(lines, 3 - role)}
+
+    def get_pattern(self, role):
+        return self.get_total_pattern(role)[role]
 
-    def get_length(self, point, role, direction):
+    def lines_pattern(self, lines, role):
         '''
-        get the AI or Opponent distribution info on one of the 8 directions
-        :param point: target point, for example: (10,10)
-        :param role: AI or Opponent
-        :param direction: one of the 8 directions on the board
-        :return: direction status dict
+        :param lines: array of the squares of every line, one line per row
+        :return: pattern of role over all the lines
         '''
-        dx, dy = direction
-        x, y = point
-        status = copy.deepcopy(self.status)
-        while True:
-            x += dx
-            y += dy
-            if 0 <= x < self.size and 0 <= y < self.size:
-                if self.board[x][y] == role:
-                    status["N"]["length"] += 1
-                else:
-                    if self.board[x][y] == 0:
-                        status["N"]["end"] = 1
-                        status = self.get_next_length((x, y), direction, role, status)
-                        if status["S"]["length"][1] > 0:
-                            status["S"]["length"][0] = copy.deepcopy(status["N"]["length"])
-                            return status
-                    return status
-            else:
-                return status
+        own = lines == role
+        other = (lines != role) & (lines != 0)
+        # lines without a stone of role have no pattern
+        keep = own.any(axis=1)
+        own = numpy.packbits(own[keep], axis=1, bitorder="little")
+        other = numpy.packbits(other[keep], axis=1, bitorder="little")
+        role_pattern = new_pattern()
+        for own_bytes, other_bytes in zip(own, other):
+            patterns = line_table(int.from_bytes(own_bytes.tobytes(), "little"),
+                                  int.from_bytes(other_bytes.tobytes(), "little"), self.size)
+            for index, count in patterns:
+                role_pattern[index] += count
+        return role_pattern
+
+
+def pattern_search(board, vectorized=None):
+    '''
+    the Pattern used to search the whole board
+    :param vectorized: True for ArrayPattern, False for Pattern, None for ArrayPattern when numpy is installed
+    '''
+    if vectorized is None:
+        vectorized = numpy is not None
+    if vectorized:
+        if numpy is None:
+            raise ImportError("ArrayPattern needs numpy")
+        return ArrayPattern(board)
+    return Pattern(board)
 
-    def get_next_length(self, point, direction, role, status):
-        dx, dy = direction
-        x, y = point
-        while True:
-            x += dx
-            y += dy
-            if 0 <= x < self.size and 0 <= y < self.size:
-                if self.board[x][y] == role:
-                    status["S"]["length"][1] += 1
-                else:
-                    if self.board[x][y] == 0:
-                        status["S"]["end"] = 1
-                    return status
-            else:
-                return status
+
+def window_offsets(length, stones):
+    '''
+    all the ways a move can take part in a window of a line, see BitBoard.match
+    :param length: number of squares of the window
+    :param stones: positions of the window that must hold stones, one of them is the move, the others are empty
+    :return: list of (offsets of the other stones, offsets of the empty squares), relative to the move
+    '''
+    return [([q - move for q in stones if q != move], [q - move for q in range(length) if q not in stones])
+            for move in stones]
+
+
+# 4 stones in a window of 5 squares: the move makes five
+FIVE_WINDOWS = window_offsets(5, range(5))
+# windows of 5 squares with 4 stones and one gap: playing the move makes a four, its gap is where the five comes
+FOUR_WINDOWS = [way for gap in range(5) for way in window_offsets(5, [p for p in range(5) if p != gap])]
+# windows _abcd_ with 3 stones among abcd: playing the move makes a three, the gap completes an open four
+THREE_WINDOWS = [way for gap in range(1, 5) for way in window_offsets(6, [p for p in range(1, 5) if p != gap])]
+# the left end of _abcd_ with 3 stones and a gap among abcd, (own offsets, empty offsets, gap)
+THREE_ENDS = [([p for p in range(1, 5) if p != gap], [5, gap], gap) for gap in range(1, 5)]
 
 
 class Kill:
     '''
-    implement method to judge the possibility to conduct a kill or to be killed in the future
+    threat-space search: can a role win by a sequence of fours (VCF) or of fours and open threes (VCT)
+    only forcing moves of the attacker and the defences against them are searched
     '''
 
-    def __init__(self, board, max_depth):
+    def __init__(self, board, max_depth, vct_depth=4, node_limit=2000):
+        '''
+        :param board: BitBoard, threats are found with its bitsets
+        :param max_depth: the most fours of a VCF
+        :param vct_depth: the most threats of a VCT, which branches much more than a VCF
+        :param node_limit: the most positions looked at by one kill, the kill fails when it is reached
+        '''
         self.max_depth = max_depth
+        self.vct_depth = vct_depth
+        self.node_limit = node_limit
         self.board = board
+        self.zobrist = board.zobrist
+        self.transposition_table = TranspositionTable()
+        self.timer = None
+        self.nodes = 0
 
-    def kill(self, role, kill_pattern, last_point):
-        return self.killer(role, kill_pattern, self.max_depth, last_point, 0)
-
-    def check_kill(self, kill_pattern, role):
+    def kill(self, role, last_point):
         '''
-        check if the pattern satisfies the kill conditions
-        :param kill_pattern: the current pattern to be checked
-        :param role: AI or Opponent
-        :return: True or False
-        '''
-        kills = {(4, 1): 0, (3, 2): 0, (3, 2, "S"): 0, (4, 0, "S"): 0, (4, 1, "S"): 0, (4, 2, "S"): 0}
-        for key in kill_pattern[role].keys():
-            length = key[0]
-            if length == 5:
-                return True, 3
-            if key == (4, 2):
-                return True, 2
-            if key == (4, 2, "S"):
-                return True, 2
-            if key in kills.keys():
-                kills[key] += kill_pattern[role][key]
-        if (kills[(4, 1)] > 0 + kills[(4, 1, "S")] + kills[(4, 0, "S")] > 0) and kills[(4, 1, "S")] + kills[(4, 1)] + \
-                kills[(3, 2)] + kills[(3, 2, "S")] + kills[(4, 0, "S")] >= 2:
-            return True, 2
-        elif kills[(3, 2)] >= 2 or kills[(3, 2, "S")] >= 2:
-            return True, 1
-        return False, 0
-
-    def killer(self, role, kill_pattern, depth, last_point, kill_score):
-        '''
-        Judge if the role could conduct a kill
+        judge if role, to move, wins by force
         :param role: AI or Opponent
-        :param kill_pattern: the current pattern
-        :param depth: the depth have reached
-        :param last_point: the last move of opponent
-        :return: True(kill successed) or False(kill failed)
+        :param last_point: the last move of the opponent
+        :return: True or False, False as well when the node limit or the time is reached
         '''
-
-        winner = Score(self.board).checkWinner(kill_pattern)
-        if winner == role:
+        self.nodes = 0
+        if len(self.fives(role)) > 0:
             return True
+        if self.killer(role, self.max_depth, False):
+            return True
+        return self.killer(role, self.vct_depth, True)
 
-        elif winner == 3 - role:
-            return False
-
-        if depth == 0:
-            return False
+    def fives(self, role):
+        '''
+        :return: the empty squares where role makes five
+        '''
+        board = self.board
+        points = set()
+        for k in range(4):
+            points.update(board.cells(k, board.match(k, role, FIVE_WINDOWS)))
+        return points
 
-        # search the most potential positions
-        frees = Board(self.board).candidates(kill_pattern, role, last_point)
-        for point, next_pattern in frees[:20]:
-            x, y = point
+    def threats(self, role, windows):
+        '''
+        :param windows: FOUR_WINDOWS or THREE_WINDOWS
+        :return: the empty squares where role makes a four or a three
+        '''
+        board = self.board
+        points = []
+        for k in range(4):
+            points.extend(board.cells(k, board.match(k, role, windows)))
+        return points
 
-            # check if I could conduct a kill
-            check, score_new = self.check_kill(next_pattern, role)
-            if check and score_new > kill_score:
-                # move to the position
-                self.board[x][y] = role
+    def defences(self, role):
+        '''
+        :return: the empty squares stopping an open three of role from becoming an open four:
+        both ends and the gap of every window _abcd_ holding 3 stones of role
+        '''
+        board = self.board
+        points = []
+        for k in range(4):
+            found = 0
+            for own, empty, gap in THREE_ENDS:
+                ends = board.match(k, role, [(own, empty)])
+                found |= ends | ends << 5 | ends << gap
+            points.extend(board.cells(k, found))
+        return points
+
+    def killer(self, role, depth, vct):
+        '''
+        role is to move and attacks, it has no five to make
+        :param role: AI or Opponent
+        :param depth: the most forcing moves left
+        :param vct: False for fours only, True for fours and open threes
+        :return: True(kill successed) or False(kill failed)
+        '''
+        blocks = self.fives(3 - role)
+        if len(blocks) > 1 or depth == 0:
+            return False
 
-                # check if the opponent could conduct a kill(for defense)
-                my_kill = not self.killer(3 - role, next_pattern, depth - 1, (x, y), score_new)
+        self.nodes += 1
+        if self.nodes > self.node_limit or (self.timer is not None and self.timer.is_up()):
+            return False
 
-                # move back
-                self.board[x][y] = 0
-                if my_kill:
+        # a kill found with less depth is still a kill, a failure with more depth is still a failure
+        tt_key = self.board.hash ^ self.zobrist.side[role] ^ self.zobrist.kill_keys[vct]
+        entry = self.transposition_table.probe(tt_key)
+        if entry is not None:
+            if entry.flag == "LOWER" and entry.depth <= depth:
+                return True
+            if entry.flag == "UPPER" and entry.depth >= depth:
+                return False
+
+        if len(blocks) == 1:
+            # the defender threatens five, the only move is to block it
+            groups = [list(blocks)]
+        else:
+            # fours first, the threes are only generated when no four wins
+            groups = [FOUR_WINDOWS, THREE_WINDOWS] if vct else [FOUR_WINDOWS]
+        tried = set()
+        for group in groups:
+            moves = group if len(blocks) == 1 else self.threats(role, group)
+            for point in moves:
+                if point in tried:
+                    continue
+                tried.add(point)
+                self.board.place(point[0], point[1], role)
+                win = self.defend(role, depth - 1, vct)
+                self.board.remove(point[0], point[1])
+                if win:
+                    self.store(tt_key, depth, "LOWER", point)
                     return True
+        self.store(tt_key, depth, "UPPER")
         return False
+
+    def defend(self, role, depth, vct):
+        '''
+        the opponent of role is to move and has to answer the threats of role,
+        it has no five to make as killer blocked it
+        :return: True if every defence loses
+        '''
+        fours = self.fives(role)
+        if len(fours) > 1:
+            return True
+        if len(fours) == 1:
+            defences = list(fours)
+        elif vct:
+            defences = self.defences(role)
+            if len(defences) == 0:
+                return False
+            # a four of the defender forces an answer before the three has to be stopped
+            defences += self.threats(3 - role, FOUR_WINDOWS)
+        else:
+            return False
+        for point in dict.fromkeys(defences):
+            self.board.place(point[0], point[1], 3 - role)
+            win = self.killer(role, depth, vct)
+            self.board.remove(point[0], point[1])
+            if not win:
+                return False
+        return True
+
+    def store(self, key, depth, flag, move=None):
+        # a search cut by the node limit or the time proves nothing
+        if self.nodes <= self.node_limit and (self.timer is None or not self.timer.is_up()):
+            self.transposition_table.store(key, int(flag == "LOWER"), depth, flag, move)